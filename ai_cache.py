@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# --- کش پاسخ‌های جمنای (SQLite) ---
+# کلید: هش نام مدل، قالب پرامپت و اعداد ورودی. اجرای مجدد برای همان روز معاملاتی (مثلاً workflow_dispatch)
+# بدون تماس با API و بلافاصله پاسخ قبلی را برمی‌گرداند. ورودی‌ها پس از TTL منقضی و
+# در صورت عبور از سقف تعداد، کم‌استفاده‌ترین‌ها حذف می‌شوند.
+
+AI_CACHE_DB_PATH = os.getenv("GEMINI_CACHE_DB", "gemini_cache.sqlite")
+AI_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CACHE_TTL_HOURS", 72)) * 3600
+AI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", 200))
+
+
+def cache_key(model_name, template, values):
+    payload = json.dumps({'model': model_name, 'template': template, 'values': values}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def open_ai_cache(path=AI_CACHE_DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, trading_date TEXT, model TEXT, "
+                 "created REAL, last_used REAL, response TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+    conn.commit()
+    return conn
+
+
+def _count(conn, name):
+    conn.execute("INSERT INTO stats (name, count) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET count = count + 1", (name,))
+
+
+def cache_stats(conn):
+    stats = dict(conn.execute("SELECT name, count FROM stats").fetchall())
+    stats['entries'] = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    return {'hits': stats.get('hits', 0), 'misses': stats.get('misses', 0), 'entries': stats['entries']}
+
+
+def get_cached_response(conn, key, ttl=AI_CACHE_TTL_SECONDS):
+    # خروجی: متن پاسخ یا None؛ هر فراخوانی در آمار hits/misses ثبت می‌شود
+    now = time.time()
+    row = conn.execute("SELECT response FROM responses WHERE key = ? AND created >= ?", (key, now - ttl)).fetchone()
+    if row: conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+    _count(conn, 'hits' if row else 'misses')
+    conn.commit()
+    return row[0] if row else None
+
+
+def store_response(conn, key, trading_date, model_name, response, ttl=AI_CACHE_TTL_SECONDS, max_entries=AI_CACHE_MAX_ENTRIES):
+    now = time.time()
+    conn.execute("INSERT OR REPLACE INTO responses (key, trading_date, model, created, last_used, response) VALUES (?, ?, ?, ?, ?, ?)",
+                 (key, str(trading_date), model_name, now, now, response))
+    conn.execute("DELETE FROM responses WHERE created < ?", (now - ttl,))
+    conn.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (max_entries,))
+    conn.commit()
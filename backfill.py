@@ -0,0 +1,115 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+import gauge
+from history_store import date_key
+
+# --- رسم دسته‌ای شاخص ترس و طمع برای روزهای گذشته (گزارش هفتگی/ماهانه) ---
+# رسم matplotlib به CPU وابسته است و thread-safe نیست، پس هر فریم در یک پردازه جدا رسم می‌شود.
+# هر پردازه یک‌بار قالب ثابت را از کش دیسک بارگذاری می‌کند و بعد فقط عقربه را رسم می‌کند.
+
+BACKFILL_DIR = "gauge_frames"
+
+
+def frame_path(out_dir, date_str):
+    return os.path.join(out_dir, f"Fear_Greed_Gauge-{str(date_str).strip().replace('/', '-')}.png")
+
+
+def _stamp_date(image, text):
+    # تاریخ روز در گوشه بالا سمت چپ فریم تا در انیمیشن و کانتکت‌شیت مشخص باشد
+    size = max(image.height // 25, 12)
+    try:
+        font = ImageFont.truetype(gauge.font_path_bold, size)
+    except OSError:
+        font = ImageFont.load_default(size=size)
+    ImageDraw.Draw(image).text((size, size), str(text), font=font, fill='#005a70')
+    return image
+
+
+def _init_worker(dpi):
+    gauge.get_gauge_template(dpi)
+
+
+def _render_frame(task):
+    date_str, value, path, dpi = task
+    image = _stamp_date(gauge.render_fear_greed_gauge(value, dpi), date_str)
+    image.save(path, dpi=(dpi, dpi))
+    return path
+
+
+def select_days(df, start=None, end=None):
+    keys = df['تاریخ'].map(date_key)
+    mask = keys > 0
+    if start: mask &= keys >= date_key(start)
+    if end: mask &= keys <= date_key(end)
+    return df[mask]
+
+
+def render_backfill(df, start=None, end=None, out_dir=BACKFILL_DIR, dpi=gauge.GAUGE_DPI, workers=None, overwrite=False):
+    # خروجی: مسیر فریم‌ها به ترتیب زمانی؛ فریم‌های موجود (مگر با overwrite) دوباره رسم نمی‌شوند
+    days = select_days(df, start, end)
+    os.makedirs(out_dir, exist_ok=True)
+    paths, tasks = [], []
+    for date_str, value in zip(days['تاریخ'], days['ارزش معاملات']):
+        path = frame_path(out_dir, date_str)
+        paths.append(path)
+        if overwrite or not os.path.exists(path): tasks.append((date_str, float(value), path, dpi))
+    print(f"\nدر حال رسم {len(tasks)} فریم از {len(paths)} روز معاملاتی...")
+    if not tasks: return paths
+
+    # قالب یک‌بار در پردازه اصلی ساخته و روی دیسک ذخیره می‌شود تا پردازه‌ها فقط آن را بخوانند
+    gauge.get_gauge_template(dpi)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks: _render_frame(task)
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dpi,)) as executor:
+            for done, _ in enumerate(executor.map(_render_frame, tasks, chunksize=chunksize), 1):
+                if done % 100 == 0: print(f"  - {done} از {len(tasks)} فریم رسم شد.")
+    print(f"✅ فریم‌ها در پوشه '{out_dir}' ذخیره شدند.")
+    return paths
+
+
+def _scaled_frames(paths, width):
+    for path in paths:
+        with Image.open(path) as frame:
+            height = round(frame.height * width / frame.width)
+            yield frame.convert('RGB').resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+
+def assemble_animation(paths, out_path, fps=4, width=800):
+    # GIF با Pillow و MP4 با ffmpeg (فریم‌ها از طریق pipe و بدون فایل میانی)
+    if not paths: raise ValueError("هیچ فریمی برای ساخت انیمیشن وجود ندارد.")
+    if out_path.lower().endswith('.gif'):
+        frames = _scaled_frames(paths, width)
+        first = next(frames)
+        first.save(out_path, save_all=True, append_images=frames, duration=round(1000 / fps), loop=0, optimize=True)
+    else:
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg: raise RuntimeError("برای ساخت MP4 نیاز به ffmpeg است.")
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'image2pipe', '-framerate', str(fps), '-i', '-',
+                   '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-pix_fmt', 'yuv420p', out_path]
+        with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+            for frame in _scaled_frames(paths, width): frame.save(process.stdin, 'PNG', compress_level=1)
+            process.stdin.close()
+        if process.returncode: raise RuntimeError(f"ffmpeg با کد {process.returncode} خارج شد.")
+    print(f"✅ انیمیشن در فایل '{out_path}' ذخیره شد.")
+    return out_path
+
+
+def build_contact_sheet(paths, out_path, columns=5, thumb_width=400, background='#f0f0f0'):
+    if not paths: raise ValueError("هیچ فریمی برای ساخت کانتکت‌شیت وجود ندارد.")
+    thumbs = list(_scaled_frames(paths, thumb_width))
+    thumb_height = max(thumb.height for thumb in thumbs)
+    rows = -(-len(thumbs) // columns)
+    sheet = Image.new('RGB', (columns * thumb_width, rows * thumb_height), background)
+    for i, thumb in enumerate(thumbs):
+        sheet.paste(thumb, ((i % columns) * thumb_width, (i // columns) * thumb_height))
+    sheet.save(out_path)
+    print(f"✅ کانتکت‌شیت {len(thumbs)} روز در فایل '{out_path}' ذخیره شد.")
+    return out_path
@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import load_fixture
+
+# --- بنچمارک سرتاسری آفلاین ---
+# main() به طور کامل و در همین پردازه اجرا می‌شود: صفحه تاریخچه از فیکسچر ضبط‌شده (یا مصنوعی) و از یک
+# سرور HTTP محلی، Bot API تلگرام از یک سرور جایگزین روی همان پورت و جمنای از یک مدل ساختگی با تأخیر
+# قابل تنظیم. زمان هر مرحله از spanهای metrics خوانده می‌شود.
+#   cold: هر اجرا در پوشه خالی (بدون تاریخچه SQLite و کش قالب شاخص)
+#   warm: اجراها در یک پوشه مشترک (دریافت افزایشی/304 و قالب کش‌شده)
+
+BOT_TOKEN = "bench"
+STUB_ANALYSIS = "<b>تیتر بمب: بازگشت قدرتمند خریدار</b>\n\n" + "تحلیل آزمایشی بنچمارک. " * 120
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, html_text):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.page = html_text.encode('utf-8')
+        self.page_gzip = gzip.compress(self.page, compresslevel=6)
+        self.etag = '"' + hashlib.sha256(self.page).hexdigest()[:16] + '"'
+        self.telegram_calls = {}
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # قطع اتصال keep-alive توسط کلاینت پس از توقف زودهنگام خواندن پاسخ خطا نیست
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)): super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *_):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            if body: self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # کلاینت پس از رسیدن به تاریخ ذخیره‌شده خواندن پاسخ را متوقف می‌کند
+            self.close_connection = True
+
+    def do_GET(self):
+        if not self.path.startswith('/market/history'): return self._send(404)
+        server = self.server
+        if self.headers.get('If-None-Match') == server.etag: return self._send(304, headers={'ETag': server.etag})
+        headers = {'Content-Type': 'text/html; charset=utf-8', 'ETag': server.etag}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            self._send(200, server.page_gzip, {**headers, 'Content-Encoding': 'gzip'})
+        else:
+            self._send(200, server.page, headers)
+
+    def do_POST(self):
+        # /bot<token>/<method>؛ بدنه (JSON یا multipart) فقط خوانده و دور ریخته می‌شود
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        method = self.path.rsplit('/', 1)[-1]
+        with self.server.lock:
+            self.server.telegram_calls[method] = self.server.telegram_calls.get(method, 0) + 1
+            message_id = sum(self.server.telegram_calls.values())
+        body = {'ok': True, 'result': {'message_id': message_id, 'photo': [{'file_id': 'bench-photo'}]}}
+        self._send(200, json.dumps(body).encode('utf-8'), {'Content-Type': 'application/json'})
+
+
+def install_gemini_stub(latency, text=STUB_ANALYSIS, chunks=20):
+    # جایگزین google.generativeai: پاسخ ثابت پس از latency ثانیه (در حالت stream به صورت تکه‌تکه)
+    class StubModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, prompt, stream=False):
+            if not stream:
+                time.sleep(latency)
+                return types.SimpleNamespace(text=text)
+            size = -(-len(text) // chunks)
+            def pieces():
+                for start in range(0, len(text), size):
+                    time.sleep(latency / chunks)
+                    yield types.SimpleNamespace(text=text[start:start + size])
+            return pieces()
+
+    genai = types.ModuleType('google.generativeai')
+    genai.configure = lambda **_: None
+    genai.GenerativeModel = StubModel
+    google = sys.modules.setdefault('google', types.ModuleType('google'))
+    google.generativeai = genai
+    sys.modules['google.generativeai'] = genai
+
+
+def run_once(market_analyzer, workdir, stream_ai, verbose, markets):
+    from metrics import enable_metrics
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        recorder = enable_metrics()
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.perf_counter()
+        with output: market_analyzer.main(use_ai_cache=False, stream_ai=stream_ai, markets=markets)
+        wall_ms = (time.perf_counter() - start) * 1000
+        return wall_ms, recorder.summary()
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک سرتاسری آفلاین main()")
+    parser.add_argument('--days', type=int, default=3000, help="تعداد روزهای فیکسچر مصنوعی (اگر فیکسچر ضبط‌شده نباشد)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--mode', choices=['cold', 'warm'], default='cold')
+    parser.add_argument('--chats', type=int, default=1, help="تعداد مقصدهای تلگرام")
+    parser.add_argument('--gemini-latency', type=float, default=1.0, help="تأخیر مدل ساختگی جمنای (ثانیه)")
+    parser.add_argument('--stream-ai', action='store_true')
+    parser.add_argument('--markets', default='bourse', help="بازارهای گزارش (همه از همان فیکسچر خوانده می‌شوند)")
+    parser.add_argument('--json', metavar='PATH', help="ذخیره نتایج در JSON")
+    parser.add_argument('--max-ms', type=float, help="حداکثر میانه زمان اجرا؛ در صورت عبور خروجی با کد ۱")
+    parser.add_argument('--verbose', action='store_true', help="نمایش خروجی main()")
+    args = parser.parse_args()
+
+    server = StubServer(load_fixture(args.days))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # متغیرها پیش از import ماژول‌ها تنظیم می‌شوند چون مقادیر پیش‌فرض هنگام import خوانده می‌شوند
+    os.environ.update({
+        'MARKET_HISTORY_URL': f"{server.base_url}/market/history?type=1", 'TELEGRAM_API_BASE': server.base_url,
+        'TELEGRAM_BOT_TOKEN': BOT_TOKEN, 'TELEGRAM_CHAT_ID': ",".join(str(-1000 - i) for i in range(args.chats)),
+        'GEMINI_API_KEY': 'bench', 'GAUGE_ARCHIVE_DIR': 'archive',
+    })
+    install_gemini_stub(args.gemini_latency)
+    import gauge
+    import market_analyzer
+
+    markets = market_analyzer.parse_markets(args.markets)
+
+    print(f"فیکسچر: {len(server.page) / 1e6:.2f} MB ({len(server.page_gzip) / 1e6:.2f} MB gzip)، حالت: {args.mode}، "
+          f"بازارها: {', '.join(markets)}، مقصدها: {args.chats}، تأخیر جمنای: {args.gemini_latency:g} ثانیه")
+    runs = []
+    with tempfile.TemporaryDirectory() as shared:
+        for i in range(args.repeat):
+            if args.mode == 'cold':
+                gauge._templates.clear()
+                gauge._needle_layers.clear()
+                with tempfile.TemporaryDirectory() as workdir: runs.append(run_once(market_analyzer, workdir, args.stream_ai, args.verbose, markets))
+            else:
+                runs.append(run_once(market_analyzer, shared, args.stream_ai, args.verbose, markets))
+            print(f"  اجرای {i + 1}: {runs[-1][0]:9.1f} ms")
+    server.shutdown()
+
+    walls = [wall for wall, _ in runs]
+    stages = {}
+    for _, summary in runs:
+        for name, stage in summary.items(): stages.setdefault(name, []).append(stage['total_ms'])
+    # زمان هر مرحله مجموع همه رشته‌هاست (مثلاً ارسال موازی به چند مقصد) و می‌تواند از زمان کل بیشتر باشد
+    print(f"\n{'stage':<24} {'median ms':>10} {'max ms':>10}")
+    for name, totals in sorted(stages.items(), key=lambda item: -statistics.median(item[1])):
+        print(f"{name:<24} {statistics.median(totals):10.1f} {max(totals):10.1f}")
+    print(f"{'wall (main)':<24} {statistics.median(walls):10.1f} {max(walls):10.1f}")
+    print(f"تماس‌های تلگرام: {server.telegram_calls}")
+
+    if args.json:
+        result = {'mode': args.mode, 'days': args.days, 'chats': args.chats, 'gemini_latency': args.gemini_latency,
+                  'wall_ms': walls, 'stages': {name: statistics.median(totals) for name, totals in stages.items()},
+                  'telegram_calls': server.telegram_calls}
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.max_ms is not None and statistics.median(walls) > args.max_ms:
+        print(f"❌ میانه زمان اجرا از حد مجاز {args.max_ms:.0f} ms بیشتر است.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# --- بنچمارک زمان شروع سرد (python -X importtime) ---
+# برای هر ماژول یک پردازه تازه اجرا و زمان تجمعی import آن از خروجی importtime خوانده می‌شود.
+# با --max-ms اگر import خود market_analyzer کندتر از حد مجاز شود، خروجی با کد ۱ پایان می‌یابد (برای CI).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['market_analyzer', 'history_store', 'telegram_client', 'table_parser', 'indicators', 'gauge', 'google.generativeai']
+
+
+def import_time_ms(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode: raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    for line in reversed(result.stderr.splitlines()):
+        if not line.startswith('import time:'): continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if name == module: return int(cumulative) / 1000
+    raise RuntimeError(f"زمان import برای {module} در خروجی importtime پیدا نشد.")
+
+
+def early_exit_ms():
+    # اجرای کامل اسکریپت بدون متغیرهای تلگرام: باید بلافاصله و بدون بارگذاری وابستگی‌های سنگین خارج شود
+    env = {key: value for key, value in os.environ.items() if not key.startswith('TELEGRAM_')}
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'market_analyzer.py'], cwd=ROOT, env=env, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک زمان import و شروع سرد")
+    parser.add_argument('--repeat', type=int, default=5, help="بهترین نتیجه از چند اجرا")
+    parser.add_argument('--max-ms', type=float, help="حداکثر زمان مجاز import برای market_analyzer")
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        try:
+            results[module] = min(import_time_ms(module) for _ in range(args.repeat))
+            print(f"{module:<22} {results[module]:9.1f} ms")
+        except RuntimeError as e:
+            print(f"{module:<22} {'—':>9}    ({e})")
+    print(f"{'early exit (no env)':<22} {min(early_exit_ms() for _ in range(args.repeat)):9.1f} ms (wall)")
+
+    if args.max_ms is not None and results.get('market_analyzer', float('inf')) > args.max_ms:
+        print(f"❌ import market_analyzer از حد مجاز {args.max_ms:.0f} ms کندتر است.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
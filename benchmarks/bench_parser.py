@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+import pandas as pd
+
+from benchmarks.fixtures import RECORDED_FIXTURE, load_fixture, record_fixture
+from table_parser import extract_raw_rows_bs4, convert_raw_rows, parse_financial_string, parse_index_string, parse_market_table, stream_market_table
+
+# --- بنچمارک پارسر جدول: مسیر قدیمی (BeautifulSoup + تبدیل سلول به سلول) در برابر پارسر ستونی ---
+
+
+def legacy_parse(html_text):
+    data = []
+    for tr in BeautifulSoup(html_text, 'html.parser').find('table', class_='sticky market').find_all('tr')[1:]:
+        tds = tr.find_all('td')
+        if len(tds) > 22 and parse_financial_string(tds[2].text) > 0:
+            data.append({"تاریخ": tds[1].text, 'ارزش معاملات': parse_financial_string(tds[2].text), 'قدرت خريد': parse_financial_string(tds[15].text), 'قدرت 5 روزه': parse_financial_string(tds[16].text), 'قدرت 20 روزه': parse_financial_string(tds[17].text), 'ورود پول': parse_financial_string(tds[18].text), 'ورود پول 5 روزه': parse_financial_string(tds[19].text), 'ورود پول 20 روزه': parse_financial_string(tds[20].text), 'شاخص کل': parse_index_string(tds[21].text), 'شاخص هم‌وزن': parse_index_string(tds[22].text)})
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک پارسر جدول تاریخچه بازار")
+    parser.add_argument('--days', type=int, default=3000, help="تعداد روزهای فیکسچر مصنوعی")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--record', action='store_true', help=f"ضبط صفحه واقعی در {RECORDED_FIXTURE}")
+    args = parser.parse_args()
+
+    if args.record: print(f"فیکسچر در '{record_fixture()}' ضبط شد.")
+    html_text = load_fixture(args.days)
+    html_bytes = html_text.encode('utf-8')
+    chunks = lambda: (html_bytes[i:i + 64 * 1024] for i in range(0, len(html_bytes), 64 * 1024))
+    print(f"اندازه فیکسچر: {len(html_bytes) / 1e6:.2f} MB")
+
+    expected, actual = legacy_parse(html_text), parse_market_table(html_text)
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual, check_dtype=False)
+    print(f"خروجی دو مسیر یکسان است ({len(actual)} روز).")
+
+    cases = [
+        ("legacy (bs4 + scalar)", lambda: legacy_parse(html_text)),
+        ("bs4 + vectorized", lambda: convert_raw_rows(extract_raw_rows_bs4(html_text))),
+        ("lxml + vectorized", lambda: parse_market_table(html_text)),
+        ("lxml stream (64 KB)", lambda: stream_market_table(chunks())),
+    ]
+    baseline = None
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{name:<24} {best * 1000:9.1f} ms   x{baseline / best:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import random
+
+# --- فیکسچر HTML صفحه تاریخچه TradersArena برای بنچمارک‌ها ---
+# اگر نسخه ضبط‌شده صفحه واقعی (با --record) وجود داشته باشد از همان استفاده می‌شود؛
+# در غیر این صورت یک صفحه مصنوعی با همان ساختار جدول ساخته می‌شود.
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RECORDED_FIXTURE = os.path.join(FIXTURE_DIR, "market_history.html")
+
+
+def record_fixture(path=RECORDED_FIXTURE, per_page=3000):
+    import requests
+
+    response = requests.get('https://tradersarena.ir/market/history?type=1', timeout=60, params={'perPage': per_page})
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    return path
+
+
+def synthetic_history_html(days=3000, seed=1403):
+    rng = random.Random(seed)
+    year, month, day = 1404, 12, 29
+    total_index, equal_index = 3_000_000, 900_000
+    rows = []
+    for i in range(days):
+        value = rng.uniform(1500, 25000)
+        value_cell = f"{value:,.1f}B" if i % 4 else f"{value * 1000:,.0f}M"
+        cells = ["<a href='#'>" + str(days - i) + "</a>", f"{year}/{month:02d}/{day:02d}", value_cell]
+        cells += [f"{rng.uniform(0, 500):,.1f}" for _ in range(12)]
+        cells += [f"{rng.uniform(-2.5, 2.5):.2f}" for _ in range(3)]
+        cells += [f"{rng.uniform(-5000, 5000):,.1f}B" for _ in range(3)]
+        cells += [f"{total_index:,}", f"{equal_index:,}", "<span>-</span>"]
+        if i % 250 == 7: cells[15] = "-"
+        rows.append("<tr>" + "".join(f"<td class='c{n}'>{cell}</td>" for n, cell in enumerate(cells)) + "</tr>")
+        total_index -= rng.randint(-40_000, 40_000)
+        equal_index -= rng.randint(-9_000, 9_000)
+        day -= 1
+        if day == 0: day, month = 30, month - 1
+        if month == 0: month, year = 12, year - 1
+    header = "<tr>" + "".join(f"<th>ستون {n}</th>" for n in range(24)) + "</tr>"
+    return ("<!DOCTYPE html><html lang='fa'><head><meta charset='utf-8'><title>تاریخچه بازار</title></head><body>"
+            "<div class='container'><table class='sticky market'><thead>" + header + "</thead><tbody>"
+            + "\n".join(rows) + "</tbody></table></div></body></html>")
+
+
+def load_fixture(days=3000):
+    if os.path.exists(RECORDED_FIXTURE):
+        with open(RECORDED_FIXTURE, encoding='utf-8') as f:
+            return f.read()
+    return synthetic_history_html(days)
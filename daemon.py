@@ -0,0 +1,166 @@
+import bisect
+import signal
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+import jdatetime
+import requests
+
+import gauge
+from history_store import date_key, load_history, open_history_db
+from indicators import INDEX_PREFIXES, MIN_MA_HISTORY, VALUE_COLUMN, IndicatorEngine
+from market_analyzer import CROSSOVER_MESSAGES, sync_history
+from telegram_client import RateLimiter, TelegramBroadcaster, get_session
+
+# --- سرویس دائمی (هشدار لحظه‌ای) ---
+# مفسر، فونت‌ها، قالب شاخص، پایگاه داده و نشست‌های HTTP یک‌بار آماده می‌شوند و در ساعات بازار منبع
+# در فواصل ثابت (با درخواست شرطی) خوانده می‌شود. پیام فقط برای تغییرات مهم روز جاری ارسال می‌شود:
+# عبور ارزش معاملات از مرزهای شاخص، رکورد تاریخی جدید و تقاطع میانگین‌های متحرک (هر کدام یک‌بار در روز).
+
+MARKET_TIMEZONE = ZoneInfo("Asia/Tehran")
+MARKET_WEEKDAYS = (5, 6, 0, 1, 2)  # شنبه تا چهارشنبه
+SEGMENT_BOUNDARIES = [segment['range'][0] for segment in gauge.GAUGE_SEGMENTS[1:]]
+
+
+def parse_market_hours(value):
+    # "09:00-13:00" -> (time(9, 0), time(13, 0))
+    start, end = (dtime.fromisoformat(part.strip()) for part in value.split('-'))
+    if start >= end: raise ValueError(f"بازه ساعات بازار نامعتبر است: {value!r}")
+    return start, end
+
+
+def segment_index(value):
+    return bisect.bisect_right(SEGMENT_BOUNDARIES, value)
+
+
+def segment_label(index):
+    return gauge.GAUGE_SEGMENTS[index]['label'].replace('\n', ' ')
+
+
+def jalali_key(moment):
+    return date_key(f"{jdatetime.date.fromgregorian(date=moment.date()):%Y/%m/%d}")
+
+
+class MarketWatcher:
+    def __init__(self, token, chat_ids, interval=60, market_hours="09:00-13:00"):
+        self.token, self.chat_ids = token, list(chat_ids)
+        self.interval = interval
+        self.open_time, self.close_time = parse_market_hours(market_hours)
+        self.limiter = RateLimiter()
+        self.stop_event = threading.Event()
+        self.conn = self.session = self.engine = None
+        self.committed_key = None
+        # وضعیت روز جاری: آخرین ناحیه شاخص و هشدارهای ارسال‌شده
+        self.day_key, self.day_segment, self.day_sent = None, None, set()
+
+    def now(self):
+        return datetime.now(MARKET_TIMEZONE)
+
+    def is_market_open(self, now):
+        return now.weekday() in MARKET_WEEKDAYS and self.open_time <= now.time() < self.close_time
+
+    def next_open(self, now):
+        for offset in range(8):
+            candidate = datetime.combine(now.date() + timedelta(days=offset), self.open_time, MARKET_TIMEZONE)
+            if candidate.weekday() in MARKET_WEEKDAYS and candidate > now: return candidate
+
+    def warm_up(self):
+        print("در حال آماده‌سازی سرویس دائمی...")
+        gauge.get_fonts()
+        gauge.get_gauge_template()
+        get_session()
+        self.session = requests.Session()
+        self.conn = open_history_db()
+        try: sync_history(self.conn, self.session)
+        except Exception as e: print(f"⚠️ خطا در دریافت داده: {e}. ادامه کار با تاریخچه ذخیره‌شده محلی.")
+
+        # روزهای قبل از امروز نهایی‌اند و در موتور ثبت می‌شوند؛ ردیف امروز در هر دریافت فقط پیش‌نمایش می‌شود
+        history = load_history(self.conn)
+        committed = history[history['تاریخ'].map(date_key) < jalali_key(self.now())].reset_index(drop=True)
+        if committed.empty: print("❌ تاریخچه‌ای برای شروع سرویس دائمی وجود ندارد."); return False
+        self.engine = IndicatorEngine(committed)
+        self.committed_key = date_key(committed['تاریخ'].iloc[-1])
+        print(f"✅ تاریخچه {len(committed)} روز معاملاتی بارگذاری شد.")
+        return True
+
+    def poll(self):
+        today = jalali_key(self.now())
+        _, fresh = sync_history(self.conn, self.session)
+        if fresh is None: return
+        current = None
+        for _, row in load_history(self.conn, self.committed_key).iterrows():
+            key = date_key(row['تاریخ'])
+            if key < today:
+                self.engine.append(row)
+                self.committed_key = key
+            elif key == today:
+                current = row
+        if current is not None: self.check_alerts(today, current)
+
+    def check_alerts(self, today, row):
+        if today != self.day_key: self.day_key, self.day_segment, self.day_sent = today, None, set()
+        indicators = self.engine.preview(row)
+        value = float(indicators[VALUE_COLUMN])
+
+        alerts = []
+        if value > indicators['value_prev_max']:
+            alerts.append(('ath:value', f"🚀 <b>رکورد جدید ارزش معاملات:</b> {value:,.1f} میلیارد.ت <i>(رکورد قبلی: {indicators['value_prev_max']:,.1f})</i>"))
+        for column, prefix in INDEX_PREFIXES.items():
+            previous_ath = indicators[f'{prefix}_prev_ath']
+            if indicators[column] > previous_ath:
+                alerts.append((f'ath:{prefix}', f"🚀 <b>رکورد جدید {column}:</b> <code>{indicators[column]:,.0f}</code> <i>(سقف قبلی: {previous_ath:,.0f})</i>"))
+        if len(self.engine) + 1 >= MIN_MA_HISTORY:
+            alerts.extend((flag, message) for flag, message in CROSSOVER_MESSAGES.items() if indicators[flag])
+        alerts = [(kind, message) for kind, message in alerts if kind not in self.day_sent]
+
+        # اولین مشاهده هر روز فقط ناحیه مبنا را تعیین می‌کند
+        segment, previous_segment = segment_index(value), self.day_segment
+        self.day_segment = segment
+        crossed = previous_segment is not None and segment != previous_segment and f'segment:{segment}' not in self.day_sent
+
+        if not (crossed or alerts): return
+        broadcaster = TelegramBroadcaster(self.token, self.chat_ids, self.limiter)
+        header = f"🗓️ تاریخ: {row['تاریخ']} | ⏱ {self.now():%H:%M}"
+        if crossed:
+            boundary = SEGMENT_BOUNDARIES[segment - 1] if segment > previous_segment else SEGMENT_BOUNDARIES[segment]
+            caption = "\n".join([
+                "<b>📊 شاخص ترس و طمع بازار سهام (لحظه‌ای)</b>", header,
+                f"<b>مقدار فعلی:</b> {value:,.1f} میلیارد تومان",
+                f"{'⬆️' if segment > previous_segment else '⬇️'} عبور از مرز {boundary:,} میلیارد؛ وضعیت: <b>{segment_label(segment)}</b>",
+                "\n🆔 @Data_Bors"])
+            broadcaster.send_photo(gauge.render_gauge_buffer(value), caption)
+            self.day_sent.add(f'segment:{segment}')
+        if alerts:
+            text = "\n".join(["🔔 <b>هشدار لحظه‌ای بازار</b>", header, ""] + [f"  - {message}" for _, message in alerts]
+                             + ["", "<i>#هشدار_لحظه‌ای</i>", "🆔 @Data_Bors"])
+            broadcaster.send_message(text, step='alert')
+            self.day_sent.update(kind for kind, _ in alerts)
+        broadcaster.print_report()
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            if not self.warm_up(): return
+            print(f"✅ سرویس دائمی آماده است (هر {self.interval:g} ثانیه، {self.open_time:%H:%M} تا {self.close_time:%H:%M} به وقت تهران).")
+            while not self.stop_event.is_set():
+                now = self.now()
+                if not self.is_market_open(now):
+                    next_open = self.next_open(now)
+                    print(f"💤 بازار بسته است؛ پایش بعدی در {next_open:%Y-%m-%d %H:%M}.")
+                    self.stop_event.wait((next_open - now).total_seconds())
+                    continue
+                started = time.monotonic()
+                try: self.poll()
+                except Exception as e: print(f"⚠️ خطا در پایش بازار: {e}")
+                self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.conn: self.conn.close()
+            if self.session: self.session.close()
+            print("سرویس دائمی متوقف شد.")
@@ -0,0 +1,307 @@
+import hashlib
+import io
+import json
+import os
+
+import functools
+
+import matplotlib
+matplotlib.use('Agg')  # رندر بدون نمایشگر؛ از بارگذاری بک‌اندهای تعاملی جلوگیری می‌کند
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+from matplotlib.patches import Wedge, Circle
+import matplotlib.font_manager as fm
+from PIL import Image, ImageDraw, ImageFont
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+from metrics import span
+
+# --- شاخص ترس و طمع با قالب پس‌زمینه کش‌شده ---
+# بخش ثابت گیج (قطاع‌ها، برچسب‌ها، عناوین) یک‌بار رسم و در حافظه و دیسک نگهداری می‌شود؛
+# در هر فراخوانی فقط عقربه و عدد مرکز روی یک لایه شفاف رسم و روی قالب ترکیب می‌شوند.
+
+GAUGE_DISPLAY_MAX = 25000.0
+GAUGE_SEGMENTS = [{'range': (0, 3000), 'color': '#d52b1e', 'label': 'ترس شدید'},
+                  {'range': (3000, 5000), 'color': '#f3c316', 'label': 'ترس'},
+                  {'range': (5000, 10000), 'color': '#808285', 'label': 'خنثی'},
+                  {'range': (10000, 15000), 'color': '#0096a8', 'label': 'طمع'},
+                  {'range': (15000, 20000), 'color': '#8dc63f', 'label': 'طمع شدید'},
+                  {'range': (20000, GAUGE_DISPLAY_MAX), 'color': '#00a651', 'label': 'طمع\nخیلی شدید'}]
+GAUGE_OUTER_LABELS = {3000: '۳ همت', 5000: '۵ همت', 10000: '۱۰ همت', 15000: '۱۵ همت', 20000: '۲۰ همت'}
+GAUGE_TITLE = "شاخص ترس و طمع بازار سهام"
+GAUGE_SUBTITLE = "(بر مبنای ارزش معاملات خرد سهام و ص. سهامی)"
+GAUGE_FOOTER = "Telegram: @Data_Bors"
+GAUGE_FIGSIZE = (10, 6)
+GAUGE_FACECOLOR = '#f0f0f0'
+GAUGE_DPI = int(os.getenv("GAUGE_DPI", "250"))
+# قالب خروجی: png8 (پالت ۲۵۶ رنگ، کوچک و سریع)، png، jpeg یا webp
+GAUGE_FORMAT = os.getenv("GAUGE_FORMAT", "png8").lower()
+GAUGE_QUALITY = int(os.getenv("GAUGE_QUALITY", "85"))
+# در صورت تنظیم، یک نسخه از تصویر ارسالی برای بایگانی روی دیسک هم ذخیره می‌شود
+GAUGE_ARCHIVE_DIR = os.getenv("GAUGE_ARCHIVE_DIR")
+GAUGE_CACHE_DIR = os.getenv("GAUGE_CACHE_DIR", ".gauge_cache")
+# با هر تغییر در نحوه رسم قالب این عدد را افزایش دهید تا کش دیسک باطل شود
+GAUGE_TEMPLATE_VERSION = 1
+
+CENTER, RADIUS, WIDTH = (0, 0), 1.0, 0.45
+TIGHT_PAD_INCHES = 0.1
+
+# تنظیم فونت (نسبت به محل همین فایل، تا اجرا از پوشه دیگر فونت را گم نکند)
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+font_path_bold = os.path.join(FONT_DIR, "Vazirmatn-FD-ExtraBold.ttf")
+font_path_regular = os.path.join(FONT_DIR, "Vazirmatn-FD-Regular.ttf")
+
+
+@functools.lru_cache(maxsize=None)
+def get_fonts():
+    # فونت‌ها در اولین رسم ساخته می‌شوند، نه هنگام import؛ خروجی (bold, regular)
+    # بررسی وجود فونت‌ها قبل از استفاده
+    if os.path.exists(font_path_bold):
+        font_prop_bold = fm.FontProperties(fname=font_path_bold)
+    else:
+        print("هشدار: فونت Vazirmatn-FD-ExtraBold.ttf یافت نشد. از فونت پیش‌فرض استفاده می‌شود.")
+        font_prop_bold = fm.FontProperties()
+
+    if os.path.exists(font_path_regular):
+        font_prop_regular = fm.FontProperties(fname=font_path_regular)
+    else:
+        print("هشدار: فونت Vazirmatn-FD-Regular.ttf یافت نشد. از فونت پیش‌فرض استفاده می‌شود.")
+        font_prop_regular = font_prop_bold
+    return font_prop_bold, font_prop_regular
+
+_templates = {}
+_needle_layers = {}
+
+
+def reshape_text(text):
+    return get_display(arabic_reshaper.reshape(str(text)))
+
+
+def _value_angle(value):
+    return 180 - (value / GAUGE_DISPLAY_MAX * 180)
+
+
+def _new_gauge_figure(dpi, facecolor):
+    fig = Figure(figsize=GAUGE_FIGSIZE, dpi=dpi, facecolor=facecolor)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_aspect('equal')
+    ax.axis('off')
+    ax.set_xlim(-1.4, 1.4); ax.set_ylim(-0.2, 1.35)
+    return fig, ax
+
+
+@functools.lru_cache(maxsize=None)
+def _file_sha256(path, size, mtime_ns):
+    with open(path, 'rb') as f: return hashlib.sha256(f.read()).hexdigest()
+
+
+def _font_fingerprint(path):
+    # هش محتوای فونت، نه زمان تغییر فایل: actions/checkout در هر اجرا mtime را عوض می‌کند و کلید کش CI هرگز تکرار نمی‌شد
+    name = os.path.basename(path)
+    if not os.path.exists(path): return [name, None]
+    stat = os.stat(path)
+    return [name, _file_sha256(path, stat.st_size, stat.st_mtime_ns)]
+
+
+def template_key(dpi):
+    spec = {'version': GAUGE_TEMPLATE_VERSION, 'segments': GAUGE_SEGMENTS, 'outer_labels': GAUGE_OUTER_LABELS,
+            'texts': [GAUGE_TITLE, GAUGE_SUBTITLE, GAUGE_FOOTER], 'figsize': GAUGE_FIGSIZE, 'facecolor': GAUGE_FACECOLOR,
+            'fonts': [_font_fingerprint(font_path_bold), _font_fingerprint(font_path_regular)], 'dpi': dpi}
+    return hashlib.sha256(json.dumps(spec, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _render_template(dpi):
+    # رسم بخش ثابت و محاسبه کادر برش معادل bbox_inches='tight'
+    font_prop_bold, font_prop_regular = get_fonts()
+    fig, ax = _new_gauge_figure(dpi, GAUGE_FACECOLOR)
+    for seg in GAUGE_SEGMENTS:
+        start_val, end_val = seg['range']
+        start_angle, end_angle = _value_angle(end_val), _value_angle(start_val)
+        ax.add_patch(Wedge(center=CENTER, r=RADIUS, theta1=start_angle, theta2=end_angle, width=WIDTH, facecolor=seg['color'], edgecolor=fig.get_facecolor(), lw=5))
+        mid_angle_rad = np.deg2rad((start_angle + end_angle) / 2)
+        x, y = (RADIUS - WIDTH / 2) * np.cos(mid_angle_rad), (RADIUS - WIDTH / 2) * np.sin(mid_angle_rad)
+        ax.text(x, y, reshape_text(seg['label']), ha='center', va='center', fontproperties=font_prop_bold, fontsize=16, color='white', linespacing=0.95)
+
+    # دایره مرکزی ثابت است؛ عقربه مشکی زیر آن روی همین رنگ رسم می‌شود و تفاوتی دیده نمی‌شود
+    ax.add_patch(Circle((0, 0), 0.18, color='black', zorder=10))
+
+    fig.text(0.5, 0.95, reshape_text(GAUGE_TITLE), ha='center', fontproperties=font_prop_bold, fontsize=28, color='#005a70')
+    fig.text(0.5, 0.89, reshape_text(GAUGE_SUBTITLE), ha='center', fontproperties=font_prop_regular, fontsize=16, color='#555555')
+
+    label_radius = RADIUS + 0.15
+    for value, text in GAUGE_OUTER_LABELS.items():
+        angle_rad = np.deg2rad(_value_angle(value))
+        x = label_radius * np.cos(angle_rad)
+        y = label_radius * np.sin(angle_rad) + 0.05
+        ax.text(x, y, reshape_text(text), ha='center', va='center', fontproperties=font_prop_regular, fontsize=14, color='black')
+
+    fig.text(0.5, 0.05, GAUGE_FOOTER, ha='center', fontproperties=font_prop_regular, fontsize=14, color='gray')
+
+    # عنوان از لبه بالای شکل بیرون می‌زند؛ پس مثل savefig کادر tight (به اینچ) را نگه می‌داریم نه برش پیکسلی
+    fig.canvas.draw()
+    tight = fig.get_tightbbox(fig.canvas.get_renderer()).padded(TIGHT_PAD_INCHES)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches=tight)
+    buffer.seek(0)
+    with Image.open(buffer) as background:
+        return background.convert('RGBA'), tuple(tight.bounds)
+
+
+def _prune_templates(keep_key, dpi):
+    # قالب‌های قدیمی همین dpi (کلید متفاوت) و فایل‌های بی‌جفت حذف می‌شوند تا پوشه کش در CI بی‌حد بزرگ نشود
+    try: names = os.listdir(GAUGE_CACHE_DIR)
+    except OSError: return
+    for name in names:
+        key, extension = os.path.splitext(name)
+        if not key.startswith('gauge-') or extension not in ('.png', '.json') or key == f"gauge-{keep_key}": continue
+        meta_path = os.path.join(GAUGE_CACHE_DIR, f"{key}.json")
+        try:
+            with open(meta_path, encoding='utf-8') as f: stale = json.load(f).get('dpi') == dpi
+        except (OSError, ValueError, AttributeError):
+            stale = True
+        if not stale: continue
+        try: os.remove(os.path.join(GAUGE_CACHE_DIR, name))
+        except OSError: pass
+
+
+def get_gauge_template(dpi=GAUGE_DPI):
+    # ترتیب جستجو: حافظه ← دیسک ← رسم مجدد (و ذخیره روی دیسک)
+    key = template_key(dpi)
+    if key in _templates: return _templates[key]
+    image_path = os.path.join(GAUGE_CACHE_DIR, f"gauge-{key}.png")
+    meta_path = os.path.join(GAUGE_CACHE_DIR, f"gauge-{key}.json")
+    template = None
+    if os.path.exists(image_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f: bounds = tuple(json.load(f)['bbox_inches'])
+            with Image.open(image_path) as cached: template = (cached.convert('RGBA'), bounds)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ کش قالب شاخص خراب است و دوباره ساخته می‌شود: {e}")
+    if template is None:
+        with span('gauge.template', dpi=dpi): template = _render_template(dpi)
+        try:
+            os.makedirs(GAUGE_CACHE_DIR, exist_ok=True)
+            template[0].save(image_path)
+            with open(meta_path, 'w', encoding='utf-8') as f: json.dump({'bbox_inches': template[1], 'dpi': dpi}, f)
+            _prune_templates(key, dpi)
+        except OSError as e:
+            print(f"⚠️ ذخیره کش قالب شاخص ممکن نشد: {e}")
+    _templates[key] = template
+    return template
+
+
+def _get_needle_layer(dpi):
+    # شکل شفاف با همان هندسه قالب که فقط عقربه و عدد مرکز را دارد؛ برای فراخوانی‌های بعدی نگه داشته می‌شود
+    if dpi not in _needle_layers:
+        font_prop_bold, _ = get_fonts()
+        fig, ax = _new_gauge_figure(dpi, 'none')
+        needle, = ax.plot([0, 0], [0, 0], color='black', lw=5, solid_capstyle='round', zorder=5)
+        center_label = ax.text(0, -0.02, '', ha='center', va='center', fontproperties=font_prop_bold, fontsize=22, color='white', zorder=11, linespacing=0.9)
+        _needle_layers[dpi] = (fig, needle, center_label)
+    return _needle_layers[dpi]
+
+
+def render_fear_greed_gauge(current_value, dpi=GAUGE_DPI):
+    background, bounds = get_gauge_template(dpi)
+    fig, needle, center_label = _get_needle_layer(dpi)
+
+    needle_angle_rad = np.deg2rad(_value_angle(min(current_value, GAUGE_DISPLAY_MAX)))
+    needle.set_data([0, (RADIUS - 0.1) * np.cos(needle_angle_rad)], [0, (RADIUS - 0.1) * np.sin(needle_angle_rad)])
+    center_text = f"{current_value / 1000:.1f}\nهمت" if current_value >= 1000 else f"{int(current_value)}\nمیلیارد ت"
+    center_label.set_text(reshape_text(center_text))
+
+    # لایه شفاف با همان کادر قالب و به صورت RGBA خام (بدون فشرده‌سازی PNG) خروجی گرفته می‌شود
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='rgba', dpi=dpi, bbox_inches=Bbox.from_bounds(*bounds))
+    overlay = Image.frombuffer('RGBA', background.size, buffer.getbuffer(), 'raw', 'RGBA', 0, 1)
+    return Image.alpha_composite(background, overlay)
+
+
+# --- خروجی درون حافظه برای آپلود مستقیم (بدون فایل موقت) ---
+GAUGE_FORMAT_EXTENSIONS = {'png': 'png', 'png8': 'png', 'jpeg': 'jpg', 'jpg': 'jpg', 'webp': 'webp'}
+
+
+def encode_gauge(image, fmt=GAUGE_FORMAT, quality=GAUGE_QUALITY, dpi=GAUGE_DPI):
+    # خروجی BytesIO با نام فایل (برای multipart) و اشاره‌گر در ابتدای بافر
+    fmt = fmt.lower()
+    if fmt not in GAUGE_FORMAT_EXTENSIONS: raise ValueError(f"قالب تصویر پشتیبانی نمی‌شود: {fmt}")
+    rgb, buffer = image.convert('RGB'), io.BytesIO()
+    if fmt == 'png8':
+        rgb.quantize(256, method=Image.Quantize.FASTOCTREE).save(buffer, 'PNG', dpi=(dpi, dpi))
+    elif fmt == 'png':
+        rgb.save(buffer, 'PNG', dpi=(dpi, dpi))
+    elif fmt in ('jpeg', 'jpg'):
+        rgb.save(buffer, 'JPEG', quality=quality, optimize=True, dpi=(dpi, dpi))
+    else:
+        rgb.save(buffer, 'WEBP', quality=quality, method=4)
+    buffer.name = f"Fear_Greed_Gauge.{GAUGE_FORMAT_EXTENSIONS[fmt]}"
+    buffer.seek(0)
+    return buffer
+
+
+def render_gauge_buffer(current_value, fmt=GAUGE_FORMAT, quality=GAUGE_QUALITY, dpi=GAUGE_DPI):
+    with span('gauge.render', dpi=dpi):
+        image = render_fear_greed_gauge(current_value, dpi)
+    with span('gauge.encode', format=fmt) as attrs:
+        buffer = encode_gauge(image, fmt, quality, dpi)
+        attrs['bytes'] = buffer.getbuffer().nbytes
+    return buffer
+
+
+def archive_gauge(buffer, file_str, archive_dir=GAUGE_ARCHIVE_DIR):
+    extension = os.path.splitext(buffer.name)[1]
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"Fear_Greed_Gauge-{file_str}{extension}")
+    with open(path, 'wb') as f: f.write(buffer.getbuffer())
+    return path
+
+
+def create_gauge_photo(current_value, file_str, archive_dir=GAUGE_ARCHIVE_DIR):
+    print(f"\nدر حال ایجاد شاخص ترس و طمع...")
+    photo = render_gauge_buffer(current_value)
+    print(f"شاخص نهایی با موفقیت در حافظه ساخته شد ({GAUGE_FORMAT}، {photo.getbuffer().nbytes / 1024:.0f} KB).")
+    if archive_dir:
+        print(f"نسخه بایگانی در فایل '{archive_gauge(photo, file_str, archive_dir)}' ذخیره شد.")
+    return photo
+
+
+# --- داشبورد چند بازار: شاخص هر بازار با عنوان آن در یک تصویر ---
+DASHBOARD_COLUMNS = 2
+
+
+def render_dashboard(items, dpi=GAUGE_DPI, columns=DASHBOARD_COLUMNS):
+    # items: [(عنوان بازار، ارزش معاملات)]؛ خروجی تصویر RGBA
+    gauges = [render_fear_greed_gauge(value, dpi) for _, value in items]
+    cell_width, gauge_height = gauges[0].size
+    title_size = max(gauge_height // 18, 12)
+    try:
+        font = ImageFont.truetype(font_path_bold, title_size)
+    except OSError:
+        font = ImageFont.load_default(size=title_size)
+    cell_height = gauge_height + title_size * 2
+    columns = min(columns, len(gauges))
+    rows = -(-len(gauges) // columns)
+    dashboard = Image.new('RGBA', (columns * cell_width, rows * cell_height), GAUGE_FACECOLOR)
+    draw = ImageDraw.Draw(dashboard)
+    for i, ((title, _), image) in enumerate(zip(items, gauges)):
+        left, top = (i % columns) * cell_width, (i // columns) * cell_height
+        draw.text((left + cell_width // 2, top + title_size), reshape_text(title), font=font, fill='#005a70', anchor='mm')
+        dashboard.alpha_composite(image, (left, top + title_size * 2))
+    return dashboard
+
+
+def create_dashboard_photo(items, file_str, archive_dir=GAUGE_ARCHIVE_DIR):
+    print(f"\nدر حال ایجاد داشبورد ترس و طمع {len(items)} بازار...")
+    with span('gauge.render', dpi=GAUGE_DPI, markets=len(items)):
+        image = render_dashboard(items)
+    with span('gauge.encode', format=GAUGE_FORMAT) as attrs:
+        photo = encode_gauge(image)
+        attrs['bytes'] = photo.getbuffer().nbytes
+    print(f"داشبورد با موفقیت در حافظه ساخته شد ({GAUGE_FORMAT}، {photo.getbuffer().nbytes / 1024:.0f} KB).")
+    if archive_dir:
+        print(f"نسخه بایگانی در فایل '{archive_gauge(photo, f'dashboard-{file_str}', archive_dir)}' ذخیره شد.")
+    return photo
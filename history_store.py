@@ -0,0 +1,88 @@
+import os
+import re
+import sqlite3
+
+# --- ذخیره‌ساز محلی تاریخچه بازار (SQLite) ---
+# هر روز معاملاتی یک ردیف با کلید تاریخ است؛ در هر اجرا فقط روزهای جدید اضافه می‌شوند.
+
+HISTORY_DB_PATH = os.getenv("MARKET_HISTORY_DB", "market_history.sqlite")
+
+# نگاشت ستون‌های دیتافریم (فارسی) به ستون‌های جدول
+HISTORY_COLUMNS = [
+    ("تاریخ", "date", "TEXT NOT NULL"),
+    ("ارزش معاملات", "trade_value", "REAL"),
+    ("قدرت خريد", "buy_power", "REAL"),
+    ("قدرت 5 روزه", "buy_power_5", "REAL"),
+    ("قدرت 20 روزه", "buy_power_20", "REAL"),
+    ("ورود پول", "money_flow", "REAL"),
+    ("ورود پول 5 روزه", "money_flow_5", "REAL"),
+    ("ورود پول 20 روزه", "money_flow_20", "REAL"),
+    ("شاخص کل", "total_index", "INTEGER"),
+    ("شاخص هم‌وزن", "equal_weight_index", "INTEGER"),
+]
+
+_DATE_PARTS = re.compile(r"(\d+)\D+(\d+)\D+(\d+)")
+
+
+def date_key(date_str):
+    # تبدیل تاریخ شمسی (مثل 1403/05/12) به عدد قابل مرتب‌سازی 14030512
+    match = _DATE_PARTS.search(str(date_str))
+    if not match:
+        raise ValueError(f"فرمت تاریخ نامعتبر است: {date_str!r}")
+    year, month, day = (int(part) for part in match.groups())
+    return year * 10000 + month * 100 + day
+
+
+def open_history_db(path=HISTORY_DB_PATH):
+    conn = sqlite3.connect(path)
+    columns_sql = ", ".join(f"{name} {sql_type}" for _, name, sql_type in HISTORY_COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS history (day INTEGER PRIMARY KEY, {columns_sql})")
+    conn.execute("CREATE TABLE IF NOT EXISTS http_cache (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT)")
+    conn.commit()
+    return conn
+
+
+def latest_history_key(conn):
+    row = conn.execute("SELECT MAX(day) FROM history").fetchone()
+    return row[0] if row else None
+
+
+def upsert_history(conn, df):
+    # ردیف‌های موجود بازنویسی می‌شوند تا اصلاحات منبع (مثلاً روز جاری) هم اعمال شود
+    if df.empty: return 0
+    names = [name for _, name, _ in HISTORY_COLUMNS]
+    placeholders = ", ".join("?" for _ in range(len(names) + 1))
+    rows = [
+        (date_key(record[0]), *record)
+        for record in df[[column for column, _, _ in HISTORY_COLUMNS]].itertuples(index=False, name=None)
+    ]
+    conn.executemany(f"INSERT OR REPLACE INTO history (day, {', '.join(names)}) VALUES ({placeholders})", rows)
+    conn.commit()
+    return len(rows)
+
+
+def load_history(conn, after_key=None):
+    # خروجی به ترتیب قدیم به جدید و با همان نام ستون‌های گزارش؛ با after_key فقط روزهای بعد از آن کلید
+    import pandas as pd
+
+    names = ", ".join(name for _, name, _ in HISTORY_COLUMNS)
+    where, params = ("WHERE day > ?", (after_key,)) if after_key is not None else ("", ())
+    df = pd.read_sql_query(f"SELECT {names} FROM history {where} ORDER BY day", conn, params=params)
+    df.columns = [column for column, _, _ in HISTORY_COLUMNS]
+    return df
+
+
+# --- اعتبارسنج‌های HTTP (ETag / Last-Modified) برای درخواست شرطی ---
+def conditional_headers(conn, url):
+    row = conn.execute("SELECT etag, last_modified FROM http_cache WHERE url = ?", (url,)).fetchone()
+    headers = {}
+    if row and row[0]: headers['If-None-Match'] = row[0]
+    if row and row[1]: headers['If-Modified-Since'] = row[1]
+    return headers
+
+
+def save_http_validators(conn, url, response_headers):
+    etag, last_modified = response_headers.get('ETag'), response_headers.get('Last-Modified')
+    if not (etag or last_modified): return
+    conn.execute("INSERT OR REPLACE INTO http_cache (url, etag, last_modified) VALUES (?, ?, ?)", (url, etag, last_modified))
+    conn.commit()
@@ -0,0 +1,215 @@
+import copy
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# --- موتور شاخص‌های مشتق‌شده ---
+# همه سری‌هایی که گزارش و پرامپت جمنای لازم دارند یک‌بار و به صورت برداری محاسبه می‌شوند
+# (میانگین‌های متحرک ارزش معاملات، تقاطع‌ها، سقف تاریخی و بازه ۲۵۲ روزه شاخص‌ها).
+
+VALUE_COLUMN = 'ارزش معاملات'
+INDEX_PREFIXES = {'شاخص کل': 'total_index', 'شاخص هم‌وزن': 'equal_weight_index'}
+MA_PERIODS = (5, 10, 30)
+YEAR_WINDOW = 252
+
+
+def _indicator_dtypes():
+    dtypes = {'تاریخ': 'object', VALUE_COLUMN: 'float64', 'value_prev_max': 'float64'}
+    dtypes.update({f'ma{period}': 'float64' for period in MA_PERIODS})
+    dtypes.update({flag: 'bool' for flag in ('ma5_above_ma10', 'ma10_above_ma30', 'ma5_cross_up', 'ma5_cross_down', 'golden_cross', 'death_cross')})
+    for column, prefix in INDEX_PREFIXES.items():
+        dtypes[column] = 'int64'
+        for suffix in ('prev_ath', 'high_252', 'low_252', 'prev_high_251', 'dist_from_high_pct', 'dist_from_low_pct'):
+            dtypes[f'{prefix}_{suffix}'] = 'float64'
+    return dtypes
+
+INDICATOR_DTYPES = _indicator_dtypes()
+
+
+def _pct_distance(current, reference):
+    # همان منطق گزارش: اگر مرجع صفر یا نامعلوم باشد فاصله صفر در نظر گرفته می‌شود
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = (current - reference) / reference * 100
+    return distance.where(reference.notna() & (reference != 0), 0.0)
+
+
+def compute_indicators(df):
+    # df: تاریخچه به ترتیب قدیم به جدید؛ خروجی هم‌طول و هم‌ترتیب با df
+    value = df[VALUE_COLUMN].astype('float64')
+    out = pd.DataFrame({'تاریخ': df['تاریخ'], VALUE_COLUMN: value})
+    for period in MA_PERIODS:
+        out[f'ma{period}'] = value.rolling(window=period).mean()
+
+    ma5, ma10, ma30 = out['ma5'], out['ma10'], out['ma30']
+    out['ma5_above_ma10'] = ma5 > ma10
+    out['ma10_above_ma30'] = ma10 > ma30
+    out['ma5_cross_down'] = (ma5.shift(1) >= ma10.shift(1)) & (ma5 < ma10)
+    out['death_cross'] = (ma10.shift(1) >= ma30.shift(1)) & (ma10 < ma30)
+    out['ma5_cross_up'] = (ma5.shift(1) <= ma10.shift(1)) & (ma5 > ma10)
+    out['golden_cross'] = (ma10.shift(1) <= ma30.shift(1)) & (ma10 > ma30)
+    out['value_prev_max'] = value.cummax().shift(1)
+
+    for column, prefix in INDEX_PREFIXES.items():
+        index = df[column].astype('int64')
+        out[column] = index
+        out[f'{prefix}_prev_ath'] = index.cummax().shift(1).astype('float64')
+        out[f'{prefix}_high_252'] = index.rolling(YEAR_WINDOW, min_periods=1).max()
+        out[f'{prefix}_low_252'] = index.rolling(YEAR_WINDOW, min_periods=1).min()
+        # سقف ۲۵۱ روز قبل از امروز (همان tail(252) بدون روز جاری) برای هشدار نزدیکی به سقف
+        out[f'{prefix}_prev_high_251'] = index.rolling(YEAR_WINDOW - 1, min_periods=1).max().shift(1)
+        out[f'{prefix}_dist_from_high_pct'] = _pct_distance(index, out[f'{prefix}_high_252'])
+        out[f'{prefix}_dist_from_low_pct'] = _pct_distance(index, out[f'{prefix}_low_252'])
+
+    return out.astype(INDICATOR_DTYPES).reset_index(drop=True)
+
+
+class _WindowExtreme:
+    # بیشینه/کمینه پنجره لغزان با صف یکنوا (هزینه سرشکن O(1) برای هر روز)
+    def __init__(self, window, use_max=True):
+        self.window, self.use_max = window, use_max
+        self.items = deque()
+        self.position = 0
+
+    def push(self, value):
+        dominated = (lambda last: last <= value) if self.use_max else (lambda last: last >= value)
+        while self.items and dominated(self.items[-1][1]): self.items.pop()
+        self.items.append((self.position, value))
+        self.position += 1
+        while self.items[0][0] <= self.position - 1 - self.window: self.items.popleft()
+
+    def current(self):
+        return float(self.items[0][1]) if self.items else math.nan
+
+
+class IndicatorEngine:
+    # نگهداری قاب شاخص‌ها و به‌روزرسانی O(1) هنگام اضافه شدن یک روز جدید (حالت سرویس دائمی)
+    def __init__(self, df):
+        self._frame = compute_indicators(df)
+        self._pending = []
+        tail_values = df[VALUE_COLUMN].astype('float64').tolist()[-max(MA_PERIODS):]
+        self._values = deque(tail_values, maxlen=max(MA_PERIODS))
+        self._value_max = float(df[VALUE_COLUMN].max()) if len(df) else math.nan
+        self._index_state = {}
+        for column in INDEX_PREFIXES:
+            history = df[column].astype('int64').tolist()
+            state = {'ath': float(max(history)) if history else math.nan,
+                     'high': _WindowExtreme(YEAR_WINDOW), 'low': _WindowExtreme(YEAR_WINDOW, use_max=False),
+                     'high_251': _WindowExtreme(YEAR_WINDOW - 1)}
+            for value in history[-YEAR_WINDOW:]:
+                for key in ('high', 'low', 'high_251'): state[key].push(value)
+            self._index_state[column] = state
+
+    def __len__(self):
+        return len(self._frame) + len(self._pending)
+
+    @property
+    def frame(self):
+        if self._pending:
+            pending = pd.DataFrame(self._pending).astype(INDICATOR_DTYPES)
+            self._frame = pd.concat([self._frame, pending], ignore_index=True)
+            self._pending = []
+        return self._frame
+
+    def last(self):
+        return pd.Series(self._pending[-1]) if self._pending else self._frame.iloc[-1]
+
+    def _moving_average(self, period):
+        if len(self._values) < period: return math.nan
+        return math.fsum(list(self._values)[-period:]) / period
+
+    def append(self, row):
+        # row: دیکشنری/سری یک روز با ستون‌های تاریخچه؛ خروجی ردیف شاخص همان روز
+        previous = self.last() if len(self) else None
+        value = float(row[VALUE_COLUMN])
+        self._values.append(value)
+        out = {'تاریخ': row['تاریخ'], VALUE_COLUMN: value}
+        for period in MA_PERIODS: out[f'ma{period}'] = self._moving_average(period)
+
+        prev_ma = {period: (previous[f'ma{period}'] if previous is not None else math.nan) for period in MA_PERIODS}
+        out['ma5_above_ma10'] = out['ma5'] > out['ma10']
+        out['ma10_above_ma30'] = out['ma10'] > out['ma30']
+        out['ma5_cross_down'] = prev_ma[5] >= prev_ma[10] and out['ma5'] < out['ma10']
+        out['death_cross'] = prev_ma[10] >= prev_ma[30] and out['ma10'] < out['ma30']
+        out['ma5_cross_up'] = prev_ma[5] <= prev_ma[10] and out['ma5'] > out['ma10']
+        out['golden_cross'] = prev_ma[10] <= prev_ma[30] and out['ma10'] > out['ma30']
+        out['value_prev_max'] = self._value_max
+        self._value_max = value if math.isnan(self._value_max) else max(self._value_max, value)
+
+        for column, prefix in INDEX_PREFIXES.items():
+            state, index = self._index_state[column], int(row[column])
+            out[column] = index
+            out[f'{prefix}_prev_ath'] = state['ath']
+            out[f'{prefix}_prev_high_251'] = state['high_251'].current()
+            for key in ('high', 'low', 'high_251'): state[key].push(index)
+            state['ath'] = float(index) if math.isnan(state['ath']) else max(state['ath'], index)
+            high, low = state['high'].current(), state['low'].current()
+            out[f'{prefix}_high_252'], out[f'{prefix}_low_252'] = high, low
+            out[f'{prefix}_dist_from_high_pct'] = (index - high) / high * 100 if high else 0.0
+            out[f'{prefix}_dist_from_low_pct'] = (index - low) / low * 100 if low else 0.0
+
+        self._pending.append(out)
+        return pd.Series(out)
+
+    def preview(self, row):
+        # ردیف شاخص یک روز بدون ثبت آن؛ برای داده‌های لحظه‌ای روز جاری که هنوز نهایی نشده‌اند
+        state = copy.deepcopy((self._values, self._value_max, self._index_state))
+        pending = len(self._pending)
+        try:
+            return self.append(row)
+        finally:
+            self._values, self._value_max, self._index_state = state
+            del self._pending[pending:]
+
+
+# --- لاگ رویدادهای تاریخی (برای بک‌تست قوانین هشدار روی کل تاریخچه) ---
+# معادل برداری همان شرط‌هایی که گزارش روزانه فقط برای روز آخر بررسی می‌کند.
+EVENT_COLUMNS = ['تاریخ', 'event', 'series', 'value', 'reference']
+MIN_MA_HISTORY = 31  # همان حداقل طول تاریخچه در analyze_moving_averages
+
+
+def _event_frame(indicators, mask, event, series, value, reference):
+    selected = indicators.index[mask.to_numpy()]
+    return pd.DataFrame({
+        'day': selected, 'تاریخ': indicators['تاریخ'].to_numpy()[selected], 'event': event, 'series': series,
+        'value': value.to_numpy()[selected], 'reference': reference.to_numpy()[selected],
+    })
+
+
+def compute_events(indicators, threshold_percent=10):
+    has_previous = pd.Series(indicators.index > 0, index=indicators.index)
+    has_ma_history = pd.Series(indicators.index >= MIN_MA_HISTORY - 1, index=indicators.index)
+    value = indicators[VALUE_COLUMN]
+    frames = [
+        _event_frame(indicators, has_ma_history & indicators['golden_cross'], 'golden_cross', 'ma10/ma30', indicators['ma10'], indicators['ma30']),
+        _event_frame(indicators, has_ma_history & indicators['death_cross'], 'death_cross', 'ma10/ma30', indicators['ma10'], indicators['ma30']),
+        _event_frame(indicators, has_ma_history & indicators['ma5_cross_up'], 'ma5_cross_up', 'ma5/ma10', indicators['ma5'], indicators['ma10']),
+        _event_frame(indicators, has_ma_history & indicators['ma5_cross_down'], 'ma5_cross_down', 'ma5/ma10', indicators['ma5'], indicators['ma10']),
+        _event_frame(indicators, has_previous & (value > indicators['value_prev_max']), 'new_ath', VALUE_COLUMN, value, indicators['value_prev_max']),
+    ]
+    for column, prefix in INDEX_PREFIXES.items():
+        index = indicators[column].astype('float64')
+        prev_ath, high, low = indicators[f'{prefix}_prev_ath'], indicators[f'{prefix}_high_252'], indicators[f'{prefix}_low_252']
+        prior_high = indicators[f'{prefix}_prev_high_251']
+        # همان اولویت generate_proximity_alert: هشدار سقف بر نکته کف مقدم است
+        near_high = (prior_high > 0) & ((prior_high - index) / prior_high * 100).abs().le(threshold_percent)
+        near_low = ~near_high & (low > 0) & ((index - low) / low * 100).abs().le(threshold_percent)
+        frames += [
+            _event_frame(indicators, has_previous & (index > prev_ath), 'new_ath', column, index, prev_ath),
+            _event_frame(indicators, has_previous & (index >= high), 'new_52w_high', column, index, high),
+            _event_frame(indicators, has_previous & (index <= low), 'new_52w_low', column, index, low),
+            _event_frame(indicators, has_previous & near_high, 'proximity_high', column, index, prior_high),
+            _event_frame(indicators, has_previous & near_low, 'proximity_low', column, index, low),
+        ]
+    events = pd.concat(frames, ignore_index=True).sort_values(['day', 'series', 'event'], kind='stable')
+    return events[EVENT_COLUMNS].reset_index(drop=True)
+
+
+def write_events(events, path):
+    # پسوند .parquet نیازمند pyarrow است؛ در غیر این صورت CSV با BOM تا در اکسل فارسی درست دیده شود
+    if str(path).lower().endswith('.parquet'):
+        events.to_parquet(path, index=False)
+    else:
+        events.to_csv(path, index=False, encoding='utf-8-sig')
+    return path
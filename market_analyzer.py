@@ -1,21 +1,24 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.patches import Wedge, Circle
-import matplotlib.font_manager as fm
-from jdatetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
-import numpy as np
 import os
-import google.generativeai as genai 
+import argparse
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+from telegram_client import parse_chat_ids
+
+# وابستگی‌های سنگین (pandas، matplotlib، requests، جمنای) فقط در مرحله‌ای که لازم‌اند بارگذاری می‌شوند
+# تا اجراهای کوتاه (مثلاً نبود متغیرهای تلگرام) روی رانرهای CI سریع تمام شوند.
 
 # --- تنظیمات اولیه ---
-now = datetime.now()
-now_str_file = f'{now:%Y-%m-%d}'
-update_time_str = f'{now:%Y/%m/%d | %H:%M}'
 DATA_SOURCE_URL = "TradersArena.ir"
+MARKET_HISTORY_URL = os.getenv("MARKET_HISTORY_URL", "https://tradersarena.ir/market/history?type=1")
+FULL_HISTORY_PER_PAGE = 3000
+INCREMENTAL_PER_PAGE = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+# بازارهای قابل تحلیل: کلید ← (پارامتر type صفحه تاریخچه، عنوان)؛ اولین بازار همان بازار پیش‌فرض است
+MARKETS = {'bourse': (1, 'بورس'), 'farabourse': (2, 'فرابورس')}
+DEFAULT_MARKET = 'bourse'
 
 # --- خواندن اطلاعات حساس از متغیرهای محیطی (برای امنیت در گیت‌هاب) ---
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -24,129 +27,16 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # --------------------
 
-# تنظیم فونت
-font_path_bold = "Vazirmatn-FD-ExtraBold.ttf"
-font_path_regular = "Vazirmatn-FD-Regular.ttf"
-
-# بررسی وجود فونت‌ها قبل از استفاده
-if os.path.exists(font_path_bold):
-    font_prop_bold = fm.FontProperties(fname=font_path_bold)
-else:
-    print("هشدار: فونت Vazirmatn-FD-ExtraBold.ttf یافت نشد. از فونت پیش‌فرض استفاده می‌شود.")
-    font_prop_bold = fm.FontProperties()
-
-if os.path.exists(font_path_regular):
-    font_prop_regular = fm.FontProperties(fname=font_path_regular)
-else:
-    print("هشدار: فونت Vazirmatn-FD-Regular.ttf یافت نشد. از فونت پیش‌فرض استفاده می‌شود.")
-    font_prop_regular = font_prop_bold
-
-def reshape_text(text):
-    return get_display(arabic_reshaper.reshape(str(text)))
-
-def send_photo_to_telegram(token, chat_id, photo_path, caption=""):
-    print("\nدر حال ارسال عکس به تلگرام...")
-    api_url = f"https://api.telegram.org/bot{token}/sendPhoto"
-    try:
-        with open(photo_path, 'rb') as photo_file:
-            response = requests.post(api_url, data={'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'},
-                                     files={'photo': photo_file}, timeout=30)
-            response.raise_for_status()
-            if response.json().get("ok"): print("✅ عکس با موفقیت به تلگرام ارسال شد.")
-            else: print(f"❌ خطا در ارسال عکس: {response.json()}")
-    except Exception as e: print(f"خطا در فرآیند ارسال عکس: {e}")
-
-# <<< تابع اصلاح شده برای مدیریت پیام‌های طولانی >>>
-def send_message_to_telegram(token, chat_id, text):
-    print("در حال ارسال پیام متنی به تلگرام...")
-    api_url = f"https://api.telegram.org/bot{token}/sendMessage"
-    
-    # تلگرام محدودیت 4096 کاراکتر دارد. ما 4000 در نظر می‌گیریم تا ایمن باشد.
-    MAX_LENGTH = 4000
-    
-    messages_to_send = []
-
-    if len(text) <= MAX_LENGTH:
-        messages_to_send.append(text)
-    else:
-        print(f"⚠️ پیام طولانی است ({len(text)} کاراکتر). در حال بخش‌بندی پیام...")
-        while len(text) > MAX_LENGTH:
-            # پیدا کردن آخرین خط جدید (\n) قبل از رسیدن به محدودیت
-            # این کار باعث می‌شود جملات یا تگ‌های HTML وسط خط قطع نشوند
-            split_index = text[:MAX_LENGTH].rfind('\n')
-            
-            # اگر خط جدید پیدا نشد، آخرین فاصله (Space) را پیدا کن
-            if split_index == -1:
-                split_index = text[:MAX_LENGTH].rfind(' ')
-            
-            # اگر هیچ فاصله‌ای هم نبود، به ناچار در همان 4000 برش بزن
-            if split_index == -1:
-                split_index = MAX_LENGTH
-            
-            messages_to_send.append(text[:split_index])
-            text = text[split_index:].lstrip() # حذف فاصله‌های اضافی ابتدای بخش بعدی
-        
-        # اضافه کردن بخش باقیمانده
-        if text:
-            messages_to_send.append(text)
-
-    # ارسال تک تک بخش‌ها
-    for i, msg in enumerate(messages_to_send):
-        payload = {'chat_id': chat_id, 'text': msg, 'parse_mode': 'HTML'}
-        try:
-            response = requests.post(api_url, json=payload, timeout=20)
-            response.raise_for_status()
-            if response.json().get("ok"): 
-                print(f"✅ پیام متنی (بخش {i+1} از {len(messages_to_send)}) با موفقیت ارسال شد.")
-            else: 
-                print(f"❌ خطا در ارسال پیام متنی بخش {i+1}: {response.json()}")
-        except Exception as e: 
-            print(f"خطا در فرآیند ارسال پیام متنی بخش {i+1}: {e}")
-
-# <<< تابع تحلیل هوش مصنوعی Gemini (نسخه حرفه‌ای + ایموجی هوشمند) >>>
-def get_gemini_analysis(last_row, previous_row, df):
-    print("\nدر حال دریافت تحلیل جامع و جذاب از هوش مصنوعی Gemini...")
-    if not GEMINI_API_KEY:
-        print("❌ کلید API جمنای یافت نشد.")
-        return None
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-3-flash-preview') 
-
-        # --- محاسبات کمکی ---
-        money_current = last_row['ورود پول']
-        money_prev = previous_row['ورود پول']
-        money_change = money_current - money_prev
-        
-        # وضعیت حجم
-        vol_current = last_row['ارزش معاملات']
-        vol_avg_5 = df['ارزش معاملات'].rolling(5).mean().iloc[-1]
-        vol_change_pct = ((vol_current - vol_avg_5) / vol_avg_5) * 100
-        vol_status_str = f"{abs(vol_change_pct):.1f}% {'بالاتر' if vol_change_pct > 0 else 'پایین‌تر'} از میانگین ۵ روزه"
-
-        # --- اصلاح منطق قدرت خریدار (مخصوص دیتای شما) ---
-        power_current = last_row['قدرت خريد']
-        power_prev = previous_row['قدرت خريد']
-        
-        # ترجمه وضعیت قدرت خریدار برای هوش مصنوعی
-        if power_current > 0:
-            power_meaning = "🟢 خریداران قوی‌تر هستند (برتری تقاضا)"
-            power_trend_text = "تقویت جبهه خرید"
-        elif power_current < 0:
-            power_meaning = "🔴 فروشندگان قوی‌تر هستند (برتری عرضه)"
-            power_trend_text = "تسلط فروشندگان"
-        else:
-            power_meaning = "⚪️ جنگ برابر (قدرت خنثی)"
-            power_trend_text = "تعادل"
-
-        prompt = f"""
+# قالب پرامپت تحلیل روزانه (در کلید کش پاسخ‌ها هم استفاده می‌شود)
+GEMINI_MODEL_NAME = 'gemini-3-flash-preview'
+GEMINI_PROMPT_TEMPLATE = """
         نقش: شما سردبیر ارشد و تحلیلگر کانال VIP "دیتا بورس" هستید.
         مخاطب: معامله‌گران حرفه‌ای که از حرف‌های کلیشه‌ای خسته‌اند و دنبال اصل مطلب هستند.
         
         لحن: صمیمی، پرانرژی، قاطع و حرفه‌ای (نه خشک و رباتیک، نه بیش از حد عامیانه).
         هدف: نوشتن یک گزارش که هم "چرایی" بازار را بگوید و هم "استراتژی" بدهد.
 
-        📊 **داده‌های امروز ({last_row['تاریخ']}):**
+        📊 **داده‌های امروز ({date}):**
 
         1️⃣ **پول هوشمند (Smart Money):**
            - جریان امروز: {money_current:+,.1f} میلیارد تومان
@@ -159,8 +49,8 @@ def get_gemini_analysis(last_row, previous_row, df):
            
         3️⃣ **حجم و تابلو:**
            - ارزش معاملات: {vol_current:,.1f} همت ({vol_status_str}).
-           - شاخص کل: {last_row['شاخص کل']:,.0f}
-           - شاخص هم‌وزن: {last_row['شاخص هم‌وزن']:,.0f}
+           - شاخص کل: {total_index:,.0f}
+           - شاخص هم‌وزن: {equal_weight_index:,.0f}
 
         📝 **ساختار گزارشی که باید بنویسی:**
         
@@ -182,27 +72,88 @@ def get_gemini_analysis(last_row, previous_row, df):
         - اگر عدد قدرت منفی است، به هیچ وجه از واژه "رشد قدرت خریدار" استفاده نکن! بگو "قدرت دست فروشنده بود".
         - تحلیل باید حس زنده بودن داشته باشد.
         """
+
+# <<< تابع تحلیل هوش مصنوعی Gemini (نسخه حرفه‌ای + ایموجی هوشمند) >>>
+def get_gemini_analysis(last_row, previous_row, indicators, use_cache=True, on_chunk=None):
+    print("\nدر حال دریافت تحلیل جامع و جذاب از هوش مصنوعی Gemini...")
+    if not GEMINI_API_KEY:
+        print("❌ کلید API جمنای یافت نشد.")
+        return None
+    cache = key = None
+    try:
+        # --- محاسبات کمکی ---
+        money_current = last_row['ورود پول']
+        money_prev = previous_row['ورود پول']
+        money_change = money_current - money_prev
+        
+        # وضعیت حجم
+        vol_current = last_row['ارزش معاملات']
+        vol_avg_5 = indicators['ma5'].iloc[-1]
+        vol_change_pct = ((vol_current - vol_avg_5) / vol_avg_5) * 100
+        vol_status_str = f"{abs(vol_change_pct):.1f}% {'بالاتر' if vol_change_pct > 0 else 'پایین‌تر'} از میانگین ۵ روزه"
+
+        # --- اصلاح منطق قدرت خریدار (مخصوص دیتای شما) ---
+        power_current = last_row['قدرت خريد']
+        power_prev = previous_row['قدرت خريد']
         
-        response = model.generate_content(prompt)
-        return response.text
+        # ترجمه وضعیت قدرت خریدار برای هوش مصنوعی
+        if power_current > 0:
+            power_meaning = "🟢 خریداران قوی‌تر هستند (برتری تقاضا)"
+            power_trend_text = "تقویت جبهه خرید"
+        elif power_current < 0:
+            power_meaning = "🔴 فروشندگان قوی‌تر هستند (برتری عرضه)"
+            power_trend_text = "تسلط فروشندگان"
+        else:
+            power_meaning = "⚪️ جنگ برابر (قدرت خنثی)"
+            power_trend_text = "تعادل"
+
+        values = {
+            'date': last_row['تاریخ'], 'money_current': money_current, 'money_change': money_change,
+            'power_current': power_current, 'power_meaning': power_meaning,
+            'vol_current': vol_current, 'vol_status_str': vol_status_str,
+            'total_index': last_row['شاخص کل'], 'equal_weight_index': last_row['شاخص هم‌وزن'],
+        }
+        prompt = GEMINI_PROMPT_TEMPLATE.format(**values)
+
+        if use_cache:
+            from ai_cache import cache_key, cache_stats, get_cached_response, open_ai_cache, store_response
+
+            with span('gemini.cache') as attrs:
+                cache, key = open_ai_cache(), cache_key(GEMINI_MODEL_NAME, GEMINI_PROMPT_TEMPLATE, values)
+                cached = get_cached_response(cache, key)
+                attrs['hit'] = bool(cached)
+            stats = cache_stats(cache)
+            print(f"🗄️ کش تحلیل: {'hit' if cached else 'miss'} (hits={stats['hits']}, misses={stats['misses']}, entries={stats['entries']})")
+            if cached:
+                if on_chunk: on_chunk(cached)
+                return cached
+
+        import google.generativeai as genai
+
+        genai.configure(api_key=GEMINI_API_KEY)
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        started = time.perf_counter()
+        with span('gemini', model=GEMINI_MODEL_NAME, stream=bool(on_chunk)) as attrs:
+            if on_chunk:
+                # حالت پخش تدریجی: هر تکه به محض تولید به on_chunk داده می‌شود
+                parts = []
+                for chunk in model.generate_content(prompt, stream=True):
+                    try: piece = chunk.text
+                    except ValueError: continue
+                    if not parts: attrs['first_chunk_ms'] = round((time.perf_counter() - started) * 1000, 3)
+                    parts.append(piece)
+                    on_chunk(piece)
+                text = "".join(parts)
+            else:
+                text = model.generate_content(prompt).text
+            attrs['chars'] = len(text or '')
+        if cache and text: store_response(cache, key, last_row['تاریخ'], GEMINI_MODEL_NAME, text)
+        return text
     except Exception as e:
         print(f"❌ خطا در تحلیل هوش مصنوعی: {e}")
         return None
-
-def parse_financial_string(s):
-    if not isinstance(s, str): return 0.0
-    s = s.strip().replace(',', '')
-    try:
-        if 'B' in s.upper(): return float(s.upper().replace('B', '').strip())
-        if 'M' in s.upper(): return float(s.upper().replace('M', '').strip()) / 1000.0
-        return float(s)
-    except (ValueError, AttributeError): return 0.0
-
-def parse_index_string(s):
-    if not isinstance(s, str): return 0
-    try:
-        return int(s.strip().replace(',', ''))
-    except (ValueError, AttributeError): return 0
+    finally:
+        if cache: cache.close()
 
 def generate_proximity_alert(current_value, high_value, low_value, high_label, low_label, threshold_percent=10):
     alert_msg = ""
@@ -218,198 +169,382 @@ def generate_proximity_alert(current_value, high_value, low_value, high_label, l
                          f"<b>احتمال</b> برگشت بازار و پایان روند نزولی وجود دارد.")
     return alert_msg
 
-def analyze_moving_averages(df):
-    analysis_points = []
-    if len(df) < 31: return analysis_points
+# پیام تقاطع‌های میانگین متحرک (به ترتیب نمایش در گزارش)؛ حالت سرویس دائمی هم از همین‌ها استفاده می‌کند
+CROSSOVER_MESSAGES = {
+    'ma5_cross_down': "⚠️ <b>هشدار تقاطع:</b> میانگین ۵ روزه امروز به زیر ۱۰ روزه عبور کرد که یک سیگنال منفی کوتاه‌مدت است.",
+    'death_cross': "🚨 <b>تقاطع مرگ (Death Cross):</b> میانگین ۱۰ روزه امروز به زیر ۳۰ روزه رفت که هشداری جدی برای تغییر روند به نزولی است.",
+    'ma5_cross_up': "💡 <b>نشانه مثبت:</b> میانگین ۵ روزه امروز به بالای ۱۰ روزه عبور کرد که یک سیگنال مثبت کوتاه‌مدت است.",
+    'golden_cross': "🚀 <b>تقاطع طلایی (Golden Cross):</b> میانگین ۱۰ روزه امروز به بالای ۳۰ روزه رفت که نشانه‌ای بسیار مهم برای تقویت روند صعودی است.",
+}
 
-    ma5 = df['ارزش معاملات'].rolling(window=5).mean()
-    ma10 = df['ارزش معاملات'].rolling(window=10).mean()
-    ma30 = df['ارزش معاملات'].rolling(window=30).mean()
+def analyze_moving_averages(indicators):
+    analysis_points = []
+    if len(indicators) < 31: return analysis_points
 
-    if ma5.iloc[-1] > ma10.iloc[-1]: analysis_points.append("<b>روند کوتاه‌مدت:</b> صعودی ✅. قرار گرفتن میانگین ۵ روزه بالاتر از ۱۰ روزه، نشان‌دهنده قدرت در کوتاه‌مدت است.")
+    today = indicators.iloc[-1]
+    if today['ma5_above_ma10']: analysis_points.append("<b>روند کوتاه‌مدت:</b> صعودی ✅. قرار گرفتن میانگین ۵ روزه بالاتر از ۱۰ روزه، نشان‌دهنده قدرت در کوتاه‌مدت است.")
     else: analysis_points.append("<b>روند کوتاه‌مدت:</b> نزولی ❌. قرار گرفتن میانگین ۵ روزه زیر ۱۰ روزه، می‌تواند نشانه‌ای از ضعف یا شروع فاز اصلاحی کوتاه‌مدت باشد.")
-    if ma10.iloc[-1] > ma30.iloc[-1]: analysis_points.append("<b>روند اصلی:</b> صعودی ✅. میانگین ۱۰ روزه بالاتر از ۳۰ روزه قرار دارد که نشان‌دهنده حاکمیت روند صعودی در میان‌مدت است.")
+    if today['ma10_above_ma30']: analysis_points.append("<b>روند اصلی:</b> صعودی ✅. میانگین ۱۰ روزه بالاتر از ۳۰ روزه قرار دارد که نشان‌دهنده حاکمیت روند صعودی در میان‌مدت است.")
     else: analysis_points.append("<b>روند اصلی:</b> نزولی ❌. میانگین ۱۰ روزه زیر ۳۰ روزه است که نشان از تضعیف روند کلی و حاکمیت فشار فروش در میان‌مدت دارد.")
-    if ma5.iloc[-2] >= ma10.iloc[-2] and ma5.iloc[-1] < ma10.iloc[-1]: analysis_points.append("⚠️ <b>هشدار تقاطع:</b> میانگین ۵ روزه امروز به زیر ۱۰ روزه عبور کرد که یک سیگنال منفی کوتاه‌مدت است.")
-    if ma10.iloc[-2] >= ma30.iloc[-2] and ma10.iloc[-1] < ma30.iloc[-1]: analysis_points.append("🚨 <b>تقاطع مرگ (Death Cross):</b> میانگین ۱۰ روزه امروز به زیر ۳۰ روزه رفت که هشداری جدی برای تغییر روند به نزولی است.")
-    if ma5.iloc[-2] <= ma10.iloc[-2] and ma5.iloc[-1] > ma10.iloc[-1]: analysis_points.append("💡 <b>نشانه مثبت:</b> میانگین ۵ روزه امروز به بالای ۱۰ روزه عبور کرد که یک سیگنال مثبت کوتاه‌مدت است.")
-    if ma10.iloc[-2] <= ma30.iloc[-2] and ma10.iloc[-1] > ma30.iloc[-1]: analysis_points.append("🚀 <b>تقاطع طلایی (Golden Cross):</b> میانگین ۱۰ روزه امروز به بالای ۳۰ روزه رفت که نشانه‌ای بسیار مهم برای تقویت روند صعودی است.")
+    analysis_points.extend(message for flag, message in CROSSOVER_MESSAGES.items() if today[flag])
     return analysis_points
 
-def create_fear_greed_gauge_real_scale(current_value, file_str):
-    print(f"\nدر حال ایجاد شاخص ترس و طمع...")
-    GAUGE_DISPLAY_MAX = 25000.0
-    segments_real = [{'range': (0, 3000), 'color': '#d52b1e', 'label': 'ترس شدید'}, 
-                     {'range': (3000, 5000), 'color': '#f3c316', 'label': 'ترس'}, 
-                     {'range': (5000, 10000), 'color': '#808285', 'label': 'خنثی'}, 
-                     {'range': (10000, 15000), 'color': '#0096a8', 'label': 'طمع'}, 
-                     {'range': (15000, 20000), 'color': '#8dc63f', 'label': 'طمع شدید'}, 
-                     {'range': (20000, GAUGE_DISPLAY_MAX), 'color': '#00a651', 'label': 'طمع\nخیلی شدید'}]
-    
-    fig, ax = plt.subplots(figsize=(10, 6), facecolor='#f0f0f0')
-    ax.set_aspect('equal')
-    ax.axis('off')
-    
-    center, radius, width = (0, 0), 1.0, 0.45
-
-    for seg in segments_real:
-        start_val, end_val = seg['range']
-        start_angle = 180 - (end_val / GAUGE_DISPLAY_MAX * 180)
-        end_angle = 180 - (start_val / GAUGE_DISPLAY_MAX * 180)
-        wedge = Wedge(center=center, r=radius, theta1=start_angle, theta2=end_angle, width=width, facecolor=seg['color'], edgecolor=fig.get_facecolor(), lw=5)
-        ax.add_patch(wedge)
-        mid_angle_rad = np.deg2rad((start_angle + end_angle) / 2)
-        x, y = (radius - width / 2) * np.cos(mid_angle_rad), (radius - width / 2) * np.sin(mid_angle_rad)
-        ax.text(x, y, reshape_text(seg['label']), ha='center', va='center', fontproperties=font_prop_bold, fontsize=16, color='white', linespacing=0.95)
-
-    needle_angle_rad = np.deg2rad(180 - (min(current_value, GAUGE_DISPLAY_MAX) / GAUGE_DISPLAY_MAX * 180))
-    needle_x = (radius - 0.1) * np.cos(needle_angle_rad)
-    needle_y = (radius - 0.1) * np.sin(needle_angle_rad)
-    ax.plot([0, needle_x], [0, needle_y], color='black', lw=5, solid_capstyle='round', zorder=5)
-    ax.add_patch(Circle((0, 0), 0.18, color='black', zorder=10))
-    center_text = f"{current_value / 1000:.1f}\nهمت" if current_value >= 1000 else f"{int(current_value)}\nمیلیارد ت"
-    ax.text(0, -0.02, reshape_text(center_text), ha='center', va='center', fontproperties=font_prop_bold, fontsize=22, color='white', zorder=11, linespacing=0.9)
-
-    fig.text(0.5, 0.95, reshape_text("شاخص ترس و طمع بازار سهام"), ha='center', fontproperties=font_prop_bold, fontsize=28, color='#005a70')
-    fig.text(0.5, 0.89, reshape_text("(بر مبنای ارزش معاملات خرد سهام و ص. سهامی)"), ha='center', fontproperties=font_prop_regular, fontsize=16, color='#555555')
-
-    outer_labels = {3000: '۳ همت', 5000: '۵ همت', 10000: '۱۰ همت', 15000: '۱۵ همت', 20000: '۲۰ همت'}
-    label_radius = radius + 0.15
-    for value, text in outer_labels.items():
-        angle_rad = np.deg2rad(180 - (value / GAUGE_DISPLAY_MAX * 180))
-        x = label_radius * np.cos(angle_rad)
-        y = label_radius * np.sin(angle_rad) + 0.05
-        ax.text(x, y, reshape_text(text), ha='center', va='center', fontproperties=font_prop_regular, fontsize=14, color='black')
-    
-    fig.text(0.5, 0.05, "Telegram: @Data_Bors", ha='center', fontproperties=font_prop_regular, fontsize=14, color='gray')
-    ax.set_xlim(-1.4, 1.4); ax.set_ylim(-0.2, 1.35)
-    
-    filename = f'Fear_Greed_Gauge-{file_str}.png'
-    plt.savefig(filename, dpi=250, bbox_inches='tight')
-    plt.close(fig)
-    print(f"شاخص نهایی با موفقیت در فایل '{filename}' ذخیره شد.")
-    return filename
+# --- دریافت داده‌ها و نگهداری تاریخچه محلی ---
+def market_history_url(market=DEFAULT_MARKET):
+    from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+    parts = urlsplit(MARKET_HISTORY_URL)
+    query = dict(parse_qsl(parts.query))
+    query['type'] = str(MARKETS[market][0])
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def market_db_path(market=DEFAULT_MARKET):
+    # بازار پیش‌فرض همان فایل قبلی را نگه می‌دارد تا تاریخچه و کش CI موجود از دست نرود
+    from history_store import HISTORY_DB_PATH
+
+    if market == DEFAULT_MARKET: return HISTORY_DB_PATH
+    root, extension = os.path.splitext(HISTORY_DB_PATH)
+    return f"{root}-{market}{extension}"
+
+def fetch_history_page(per_page, conn, stop_at_key=None, session=None, url=MARKET_HISTORY_URL, require_overlap=False):
+    # دانلود و پارس جریانی صفحه تاریخچه؛ خروجی (دیتافریم یا None در صورت 304، رسیدن به تاریخچه محلی)
+    # با require_overlap صفحه‌ای که به تاریخچه محلی نمی‌رسد ذخیره نمی‌شود: اگر دریافت کامل بعدی شکست بخورد،
+    # ذخیره آن حفره‌ای دائمی در تاریخچه می‌ساخت که اجراهای بعدی (که فقط صفحه آخر را می‌خوانند) هرگز پر نمی‌کردند
+    import requests
+    from history_store import conditional_headers, save_http_validators, upsert_history
+    from table_parser import stream_market_table
+
+    cache_url = f"{url}&perPage={per_page}"
+    headers = {'Accept-Encoding': 'gzip, deflate', **conditional_headers(conn, cache_url)}
+    with span('fetch', per_page=per_page) as attrs, \
+            (session or requests).get(url, timeout=30, params={'perPage': per_page}, headers=headers, stream=True) as response:
+        attrs['status'] = response.status_code
+        if response.status_code == 304:
+            print("ℹ️ صفحه تاریخچه از آخرین دریافت تغییری نکرده است.")
+            return None, True
+        response.raise_for_status()
+        df, reached_known = stream_market_table(response.iter_content(STREAM_CHUNK_SIZE), response.encoding or 'utf-8', stop_at_key)
+        validators = response.headers
+        attrs['rows'] = len(df)
+    if require_overlap and not reached_known: return df, False
+    # اعتبارسنج‌ها پس از ذخیره داده ثبت می‌شوند تا در صورت خطا، اجرای بعد دوباره دانلود کند
+    with span('history.store', rows=len(df)):
+        upsert_history(conn, df)
+        save_http_validators(conn, cache_url, validators)
+    return df, reached_known
+
+def sync_history(conn, session=None, url=MARKET_HISTORY_URL):
+    # خروجی (آخرین کلید ذخیره‌شده پیش از دریافت، دیتافریم روزهای دریافت‌شده یا None)
+    from history_store import latest_history_key
+
+    known_key = latest_history_key(conn)
+    # اگر تاریخچه محلی داریم فقط صفحه آخر را تا رسیدن به آخرین روز ذخیره‌شده می‌خوانیم
+    # (خود آن روز هم دوباره خوانده می‌شود تا داده‌های روز جاری به‌روز شوند)
+    fresh, reached_known = fetch_history_page(INCREMENTAL_PER_PAGE if known_key else FULL_HISTORY_PER_PAGE, conn, known_key, session, url,
+                                              require_overlap=bool(known_key))
+    if known_key and not reached_known:
+        print("⚠️ فاصله‌ای بین تاریخچه محلی و داده‌های جدید وجود دارد. در حال دریافت کامل تاریخچه...")
+        fresh, _ = fetch_history_page(FULL_HISTORY_PER_PAGE, conn, known_key, session, url)
+    return known_key, fresh
+
+def load_market_data(market=DEFAULT_MARKET):
+    from history_store import date_key, latest_history_key, load_history, open_history_db
+
+    print(f"در حال دریافت داده‌ها{'' if market == DEFAULT_MARKET else f' ({MARKETS[market][1]})'}...")
+    conn = open_history_db(market_db_path(market))
+    try:
+        known_key = latest_history_key(conn)
+        try:
+            _, fresh = sync_history(conn, url=market_history_url(market))
+            if fresh is not None:
+                new_days = len(fresh) if not known_key else int((fresh['تاریخ'].map(date_key) > known_key).sum())
+                print(f"داده‌های {len(fresh)} روز با موفقیت دریافت شد ({new_days} روز جدید).")
+        except Exception as e:
+            if not known_key: print(f"خطا در دریافت داده: {e}"); return None
+            print(f"⚠️ خطا در دریافت داده: {e}. ادامه کار با تاریخچه ذخیره‌شده محلی.")
+        with span('history.load'): return load_history(conn)
+    finally:
+        conn.close()
+
+
+def format_ai_message(ai_analysis):
+    disclaimer = (
+        "⚠️ <b>سلب مسئولیت:</b> تحلیل فوق صرفاً توسط هوش مصنوعی و بر اساس داده‌های آماری استخراج شده است. "
+        "بازارهای مالی همواره با ریسک همراه هستند؛ لذا این گزارش نباید مبنای مستقیم خرید یا فروش قرار گیرد "
+        "و این کانال هیچ‌گونه مسئولیتی در قبال سود یا ضرر کاربران عزیز ندارد."
+    )
+
+    return ai_analysis + "\n\n" + "\n".join([
+        f"<i>🤖 این تحلیل توسط هوش مصنوعی تولید شده است.</i>",
+        disclaimer,
+        "🆔 @Data_Bors"
+    ])
+
+# --- بخش‌های گزارش ---
+def market_status(value):
+    return "<b>ترس شدید</b> 🥶" if value < 3000 else "<b>ترس</b> 😟" if value < 5000 else "<b>خنثی</b> 😐" if value < 10000 else "<b>طمع</b> 😊" if value < 15000 else "<b>طمع شدید</b> 🤩🔥" if value < 20000 else "<b>طمع خیلی شدید</b> 🤑🚀"
+
+def build_market_blocks(df, indicators):
+    # بلوک‌های تحلیل ارزش معاملات، شاخص‌ها و آمار تکمیلی یک بازار
+    from indicators import INDEX_PREFIXES
+
+    last_row, previous_row = df.iloc[-1], df.iloc[-2]
+    last_ind, prev_ind = indicators.iloc[-1], indicators.iloc[-2]
+    last_value = last_row['ارزش معاملات']
+
+    full_message_blocks = []
+    block1_parts = ["📈 <b>تحلیل ارزش معاملات</b>"]
+
+    # --- اضافه کردن تشخیص رکورد ارزش معاملات ---
+    val_record_badge = ""
+    if len(df) > 1:
+        prev_max_val = last_ind['value_prev_max']
+        if last_value > prev_max_val:
+            val_record_badge = " (🚀 <b>رکورد جدید!</b>)"
+    # ---------------------------------------------
+
+    change = last_value - previous_row['ارزش معاملات']; percent = (change / previous_row['ارزش معاملات'] * 100) if previous_row['ارزش معاملات'] else 0
+    block1_parts.append(f"• <b>مقدار امروز:</b> {last_value:,.1f} میلیارد.ت{val_record_badge}"); block1_parts.append(f"• <b>تغییر روزانه:</b> {abs(change):,.1f} میلیارد.ت {'کاهش' if change < 0 else 'افزایش'} {'⬇️' if change < 0 else '⬆️'} ({percent:+.1f}%)")
+    if len(df) > 30:
+        block1_parts.append("\n<b>میانگین‌های متحرک:</b>")
+        for period in [5, 10, 30]:
+            current_avg, prev_avg = last_ind[f'ma{period}'], prev_ind[f'ma{period}']
+            ma_trend = "⬆️" if current_avg > prev_avg else ("⬇️" if current_avg < prev_avg else "↔️")
+            block1_parts.append(f"  - {period} روزه: <b>{current_avg:,.1f}</b> <i>(دیروز: {prev_avg:,.1f})</i> {ma_trend}")
+        ma_analysis = analyze_moving_averages(indicators)
+        if ma_analysis: block1_parts.append("\n" + "🔔 <b>تحلیل تکنیکال (ارزش معاملات):</b>"); block1_parts.extend([f"  - {point}" for point in ma_analysis])
+    full_message_blocks.append("\n".join(block1_parts))
+
+    block_indices = ["📉 <b>تحلیل شاخص‌های بازار</b>"]
+    for name, key in [('کل', 'شاخص کل'), ('هم‌وزن', 'شاخص هم‌وزن')]:
+        prefix = INDEX_PREFIXES[key]
+        current_idx, prev_idx = last_row[key], previous_row[key]
+        idx_change, idx_percent = current_idx - prev_idx, (current_idx - prev_idx) / prev_idx * 100 if prev_idx else 0
+
+        ath_record_badge = ""
+        ath_message = ""
+        if len(df) > 1:
+            previous_ath = last_ind[f'{prefix}_prev_ath']
+            if current_idx > previous_ath:
+                ath_record_badge = " (🚀 <b>رکورد جدید!</b>)"
+            ath_message = f"  - سقف تاریخی: {int(max(current_idx, previous_ath)):,.0f}"
+        else:
+            ath_message = f"  - سقف تاریخی: {current_idx:,.0f}"
+
+        yearly_low = last_ind[f'{prefix}_low_252']
+        yearly_high = last_ind[f'{prefix}_high_252']
+
+        dist_from_high = last_ind[f'{prefix}_dist_from_high_pct']
+        dist_from_low = last_ind[f'{prefix}_dist_from_low_pct']
+
+        yearly_high_message = f"📈<code>{int(yearly_high):,.0f}</code> (<b>{dist_from_high:+.1f}%</b>)"
+        if current_idx >= yearly_high: yearly_high_message = f"📈<code>{current_idx:,.0f}</code> (<b>رکورد جدید سال!</b>)"
+
+        yearly_range_message = f"  - بازه یکساله (📉<code>{int(yearly_low):,.0f}</code> (<b>{dist_from_low:+.1f}%</b>) | {yearly_high_message})"
+
+        idx_parts = [
+            f"⚪️ <b>شاخص {name}</b>" if name == 'کل' else f"⚖️ <b>شاخص {name}</b>",
+            f"  - مقدار فعلی: <code>{current_idx:,.0f}</code>{ath_record_badge} <b>({idx_change:+,.0f} | {idx_percent:+.2f}%)</b> {'⬆️' if idx_change >= 0 else '⬇️'}",
+            ath_message, yearly_range_message
+        ]
+
+        proximity_alert = generate_proximity_alert(current_idx, last_ind[f'{prefix}_prev_high_251'], yearly_low, "سقف یکساله", "کف یکساله")
+        if proximity_alert: idx_parts.append(proximity_alert)
+        block_indices.append("\n".join(idx_parts))
+    full_message_blocks.append("\n\n".join(block_indices))
 
+    block3_parts = ["📊 <b>آمار تکمیلی بازار</b>"]
+    p_power, p_power_prev = last_row['قدرت خريد'], previous_row['قدرت خريد']; p_money, p_money_prev = last_row['ورود پول'], previous_row['ورود پول']
+    block3_parts.append(f"{'✅' if p_power >= 1 else '❌'} <b>قدرت خریدار:</b> <b>{p_power:.2f}</b> <i>(دیروز: {p_power_prev:.2f})</i> {'⬆️' if p_power > p_power_prev else '⬇️'}\n" f"    <i>میانگین ۵ روزه:</i>  {last_row['قدرت 5 روزه']:.2f}\n" f"    <i>میانگین ۲۰ روزه:</i> {last_row['قدرت 20 روزه']:.2f}")
+    block3_parts.append(f"{'🟢' if p_money >= 0 else '🔴'} <b>ورود پول:</b> <b>{p_money:,.1f}</b> میلیارد.ت <i>(دیروز: {p_money_prev:,.1f})</i> {'⬆️' if p_money > p_money_prev else '⬇️'}\n" f"    <i>میانگین ۵ روزه:</i>  {last_row['ورود پول 5 روزه']:,.1f}\n" f"    <i>میانگین ۲۰ روزه:</i> {last_row['ورود پول 20 روزه']:,.1f}")
+    full_message_blocks.append("\n\n".join(block3_parts))
+    return full_message_blocks
+
+def build_footer(update_time_str):
+    footer_parts = [f"<i>⏳ بروزرسانی: {update_time_str}</i>", f"🔗 منبع داده‌ها: <code>{DATA_SOURCE_URL}</code>", f"<i>#گزارش_روزانه_بازار</i>", f"🆔 @Data_Bors"]
+    return "\n".join(footer_parts)
+
+def load_markets(markets):
+    # خروجی {بازار: دیتافریم یا None}؛ دریافت و پارس چند بازار همزمان انجام می‌شود
+    if len(markets) == 1: return {markets[0]: load_market_data(markets[0])}
+    with ThreadPoolExecutor(max_workers=len(markets), thread_name_prefix='market') as executor:
+        return dict(zip(markets, executor.map(load_market_data, markets)))
 
 # --- مراحل اصلی اجرا ---
-def main():
-    if not all([TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID]):
+def main(use_ai_cache=True, stream_ai=False, markets=(DEFAULT_MARKET,)):
+    if not all([TELEGRAM_BOT_TOKEN, parse_chat_ids(TELEGRAM_CHAT_ID)]):
         print("❌ متغیرهای محیطی تلگرام (TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID) تنظیم نشده‌اند.")
         return
 
-    print("در حال دریافت داده‌ها...")
-    data = []
-    try:
-        html = requests.get('https://tradersarena.ir/market/history?type=1', timeout=30, params={'perPage': 3000})
-        html.raise_for_status()
-        for tr in BeautifulSoup(html.text, 'html.parser').find('table', class_='sticky market').find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) > 22 and parse_financial_string(tds[2].text) > 0:
-                data.append({"تاریخ": tds[1].text, 'ارزش معاملات': parse_financial_string(tds[2].text), 'قدرت خريد': parse_financial_string(tds[15].text), 'قدرت 5 روزه': parse_financial_string(tds[16].text), 'قدرت 20 روزه': parse_financial_string(tds[17].text), 'ورود پول': parse_financial_string(tds[18].text), 'ورود پول 5 روزه': parse_financial_string(tds[19].text), 'ورود پول 20 روزه': parse_financial_string(tds[20].text), 'شاخص کل': parse_index_string(tds[21].text), 'شاخص هم‌وزن': parse_index_string(tds[22].text)})
-        print(f"داده‌های {len(data)} روز با موفقیت دریافت شد.")
-    except Exception as e: print(f"خطا در دریافت داده: {e}"); return
-    if len(data) < 2: print("داده کافی برای تحلیل مقایسه‌ای وجود ندارد."); return
-
-    df = pd.DataFrame(data).iloc[::-1].reset_index(drop=True)
-    last_row, previous_row = df.iloc[-1], df.iloc[-2]
-    last_value = last_row['ارزش معاملات']
-    last_date = last_row['تاریخ']
-    generated_filename = create_fear_greed_gauge_real_scale(last_value, now_str_file)
+    from jdatetime import datetime
+
+    now = datetime.now()
+    now_str_file = f'{now:%Y-%m-%d}'
+    update_time_str = f'{now:%Y/%m/%d | %H:%M}'
+
+    # با چند بازار، گزارش تجمیعی (داشبورد شاخص و بخش جدا برای هر بازار) ساخته می‌شود
+    markets = list(markets)
+    combined = len(markets) > 1
+    frames = load_markets(markets)
+
+    from indicators import compute_indicators
+
+    analyses = {}
+    for market, df in frames.items():
+        if df is None: continue
+        if len(df) < 2: print("داده کافی برای تحلیل مقایسه‌ای وجود ندارد."); continue
+        with span('indicators', market=market, rows=len(df)): analyses[market] = (df, compute_indicators(df))
+    if not analyses: return
+
+    # تحلیل جمنای از همین حالا در پس‌زمینه شروع می‌شود تا با رسم شاخص و ارسال‌ها همپوشانی داشته باشد؛
+    # ترتیب پیام‌ها در کانال تغییری نمی‌کند چون ارسال‌ها همچنان به ترتیب در همین رشته انجام می‌شوند.
+    # پخش تدریجی فقط برای گزارش تک‌بازاری است.
+    ai_stream = queue.Queue() if stream_ai and not combined else None
+    ai_executor = ThreadPoolExecutor(max_workers=len(analyses), thread_name_prefix='gemini')
+    ai_futures = {market: ai_executor.submit(get_gemini_analysis, df.iloc[-1], df.iloc[-2], indicators, use_ai_cache, ai_stream.put if ai_stream else None)
+                  for market, (df, indicators) in analyses.items()}
+    ai_executor.shutdown(wait=False)
+
+    last_values = {market: df.iloc[-1]['ارزش معاملات'] for market, (df, _) in analyses.items()}
+    last_dates = {market: df.iloc[-1]['تاریخ'] for market, (df, _) in analyses.items()}
+    last_date = next(iter(last_dates.values()))
+    # اگر داده یک بازار قدیمی است (مثلاً از تاریخچه محلی پس از خطای دریافت)، تاریخ هر بازار کنار مقدار خودش نوشته می‌شود
+    dates_differ = len(set(last_dates.values())) > 1
+    if dates_differ: print("⚠️ آخرین تاریخ بازارها یکسان نیست: " + "، ".join(f"{MARKETS[market][1]} {date}" for market, date in last_dates.items()))
+    if combined:
+        from gauge import create_dashboard_photo
+
+        gauge_photo = create_dashboard_photo([(f"بازار {MARKETS[market][1]}", value) for market, value in last_values.items()], now_str_file)
+    else:
+        from gauge import create_gauge_photo
 
-    if generated_filename:
-        status_short = "وضعیت: " + ("<b>ترس شدید</b> 🥶" if last_value < 3000 else "<b>ترس</b> 😟" if last_value < 5000 else "<b>خنثی</b> 😐" if last_value < 10000 else "<b>طمع</b> 😊" if last_value < 15000 else "<b>طمع شدید</b> 🤩🔥" if last_value < 20000 else "<b>طمع خیلی شدید</b> 🤑🚀")
-        
-        photo_caption = "\n".join([f"<b>📊 شاخص ترس و طمع بازار سهام</b>", f"🗓️ تاریخ: {last_date}", f"<b>مقدار فعلی:</b> {last_value:,.1f} میلیارد تومان", status_short, "\n🆔 @Data_Bors"])
-        send_photo_to_telegram(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, generated_filename, photo_caption)
+        gauge_photo = create_gauge_photo(last_values[markets[0]], now_str_file)
+
+    if gauge_photo:
+        if combined:
+            photo_caption = "\n".join([f"<b>📊 شاخص ترس و طمع بازارها</b>"] + ([] if dates_differ else [f"🗓️ تاریخ: {last_date}"])
+                                      + [f"🏛 <b>{MARKETS[market][1]}:</b> {value:,.1f} میلیارد تومان | {market_status(value)}"
+                                         + (f" | 🗓️ {last_dates[market]}" if dates_differ else "") for market, value in last_values.items()]
+                                      + ["\n🆔 @Data_Bors"])
+        else:
+            last_value = last_values[markets[0]]
+            photo_caption = "\n".join([f"<b>📊 شاخص ترس و طمع بازار سهام</b>", f"🗓️ تاریخ: {last_date}", f"<b>مقدار فعلی:</b> {last_value:,.1f} میلیارد تومان", "وضعیت: " + market_status(last_value), "\n🆔 @Data_Bors"])
+        from telegram_client import TelegramBroadcaster
+
+        broadcaster = TelegramBroadcaster(TELEGRAM_BOT_TOKEN, parse_chat_ids(TELEGRAM_CHAT_ID))
+        broadcaster.send_photo(gauge_photo, photo_caption)
 
         full_message_blocks = []
-        block1_parts = ["📈 <b>تحلیل ارزش معاملات</b>"]
-        
-        # --- اضافه کردن تشخیص رکورد ارزش معاملات ---
-        val_record_badge = ""
-        if len(df) > 1:
-            prev_max_val = df['ارزش معاملات'][:-1].max()
-            if last_value > prev_max_val:
-                val_record_badge = " (🚀 <b>رکورد جدید!</b>)"
-        # ---------------------------------------------
-        
-        change = last_value - previous_row['ارزش معاملات']; percent = (change / previous_row['ارزش معاملات'] * 100) if previous_row['ارزش معاملات'] else 0
-        block1_parts.append(f"• <b>مقدار امروز:</b> {last_value:,.1f} میلیارد.ت{val_record_badge}"); block1_parts.append(f"• <b>تغییر روزانه:</b> {abs(change):,.1f} میلیارد.ت {'کاهش' if change < 0 else 'افزایش'} {'⬇️' if change < 0 else '⬆️'} ({percent:+.1f}%)")
-        if len(df) > 30:
-            block1_parts.append("\n<b>میانگین‌های متحرک:</b>")
-            for period in [5, 10, 30]:
-                ma_series = df['ارزش معاملات'].rolling(window=period).mean(); current_avg, prev_avg = ma_series.iloc[-1], ma_series.iloc[-2]
-                ma_trend = "⬆️" if current_avg > prev_avg else ("⬇️" if current_avg < prev_avg else "↔️")
-                block1_parts.append(f"  - {period} روزه: <b>{current_avg:,.1f}</b> <i>(دیروز: {prev_avg:,.1f})</i> {ma_trend}")
-            ma_analysis = analyze_moving_averages(df)
-            if ma_analysis: block1_parts.append("\n" + "🔔 <b>تحلیل تکنیکال (ارزش معاملات):</b>"); block1_parts.extend([f"  - {point}" for point in ma_analysis])
-        full_message_blocks.append("\n".join(block1_parts))
-
-        block_indices = ["📉 <b>تحلیل شاخص‌های بازار</b>"]
-        for name, key in [('کل', 'شاخص کل'), ('هم‌وزن', 'شاخص هم‌وزن')]:
-            current_idx, prev_idx = last_row[key], previous_row[key]
-            idx_change, idx_percent = current_idx - prev_idx, (current_idx - prev_idx) / prev_idx * 100 if prev_idx else 0
-            
-            ath_record_badge = ""
-            ath_message = ""
-            if len(df) > 1:
-                previous_ath = df[key][:-1].max()
-                if current_idx > previous_ath:
-                    ath_record_badge = " (🚀 <b>رکورد جدید!</b>)"
-                ath_message = f"  - سقف تاریخی: {int(max(current_idx, previous_ath)):,.0f}"
-            else:
-                ath_message = f"  - سقف تاریخی: {current_idx:,.0f}"
-
-            yearly_subset = df.tail(252)
-            yearly_low = yearly_subset[key].min()
-            yearly_high = yearly_subset[key].max()
-            
-            dist_from_high = (current_idx - yearly_high) / yearly_high * 100 if yearly_high else 0
-            dist_from_low = (current_idx - yearly_low) / yearly_low * 100 if yearly_low else 0
-
-            yearly_high_message = f"📈<code>{int(yearly_high):,.0f}</code> (<b>{dist_from_high:+.1f}%</b>)"
-            if current_idx >= yearly_high: yearly_high_message = f"📈<code>{current_idx:,.0f}</code> (<b>رکورد جدید سال!</b>)"
-            
-            yearly_range_message = f"  - بازه یکساله (📉<code>{int(yearly_low):,.0f}</code> (<b>{dist_from_low:+.1f}%</b>) | {yearly_high_message})"
-
-            idx_parts = [
-                f"⚪️ <b>شاخص {name}</b>" if name == 'کل' else f"⚖️ <b>شاخص {name}</b>",
-                f"  - مقدار فعلی: <code>{current_idx:,.0f}</code>{ath_record_badge} <b>({idx_change:+,.0f} | {idx_percent:+.2f}%)</b> {'⬆️' if idx_change >= 0 else '⬇️'}",
-                ath_message, yearly_range_message
-            ]
-            
-            proximity_alert = generate_proximity_alert(current_idx, yearly_subset[key][:-1].max(), yearly_low, "سقف یکساله", "کف یکساله")
-            if proximity_alert: idx_parts.append(proximity_alert)
-            block_indices.append("\n".join(idx_parts))
-        full_message_blocks.append("\n\n".join(block_indices))
-        
-        block3_parts = ["📊 <b>آمار تکمیلی بازار</b>"]
-        p_power, p_power_prev = last_row['قدرت خريد'], previous_row['قدرت خريد']; p_money, p_money_prev = last_row['ورود پول'], previous_row['ورود پول']
-        block3_parts.append(f"{'✅' if p_power >= 1 else '❌'} <b>قدرت خریدار:</b> <b>{p_power:.2f}</b> <i>(دیروز: {p_power_prev:.2f})</i> {'⬆️' if p_power > p_power_prev else '⬇️'}\n" f"    <i>میانگین ۵ روزه:</i>  {last_row['قدرت 5 روزه']:.2f}\n" f"    <i>میانگین ۲۰ روزه:</i> {last_row['قدرت 20 روزه']:.2f}")
-        block3_parts.append(f"{'🟢' if p_money >= 0 else '🔴'} <b>ورود پول:</b> <b>{p_money:,.1f}</b> میلیارد.ت <i>(دیروز: {p_money_prev:,.1f})</i> {'⬆️' if p_money > p_money_prev else '⬇️'}\n" f"    <i>میانگین ۵ روزه:</i>  {last_row['ورود پول 5 روزه']:,.1f}\n" f"    <i>میانگین ۲۰ روزه:</i> {last_row['ورود پول 20 روزه']:,.1f}")
-        full_message_blocks.append("\n\n".join(block3_parts))
-    
-        footer_parts = [f"<i>⏳ بروزرسانی: {update_time_str}</i>", f"🔗 منبع داده‌ها: <code>{DATA_SOURCE_URL}</code>", f"<i>#گزارش_روزانه_بازار</i>", f"🆔 @Data_Bors"]
-        full_message_blocks.append("\n".join(footer_parts))
+        for market, (df, indicators) in analyses.items():
+            market_blocks = build_market_blocks(df, indicators)
+            if combined: market_blocks[0] = f"🏛 <b>بازار {MARKETS[market][1]}</b>\n\n" + market_blocks[0]
+            full_message_blocks.extend(market_blocks)
+        full_message_blocks.append(build_footer(update_time_str))
 
         data_message = ("\n\n" + "-" * 35 + "\n\n").join(filter(None, full_message_blocks))
-        send_message_to_telegram(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, data_message)
+        broadcaster.send_message(data_message, step='data')
 
         # --- بخش تحلیل هوش مصنوعی با متن عدم مسئولیت ---
-        ai_analysis = get_gemini_analysis(last_row, previous_row, df)
-        if ai_analysis:
-            disclaimer = (
-                "⚠️ <b>سلب مسئولیت:</b> تحلیل فوق صرفاً توسط هوش مصنوعی و بر اساس داده‌های آماری استخراج شده است. "
-                "بازارهای مالی همواره با ریسک همراه هستند؛ لذا این گزارش نباید مبنای مستقیم خرید یا فروش قرار گیرد "
-                "و این کانال هیچ‌گونه مسئولیتی در قبال سود یا ضرر کاربران عزیز ندارد."
-            )
-            
-            ai_message = ai_analysis + "\n\n" + "\n".join([
-                f"<i>🤖 این تحلیل توسط هوش مصنوعی تولید شده است.</i>",
-                disclaimer,
-                "🆔 @Data_Bors"
-            ])
-            send_message_to_telegram(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, ai_message)
+        # اگر تولید هنوز تمام نشده، متن به صورت تدریجی نمایش داده می‌شود؛ در غیر این صورت یک‌جا ارسال می‌شود
+        ai_future = next(iter(ai_futures.values()))
+        if ai_stream is not None and not ai_future.done():
+            ai_future.add_done_callback(lambda _: ai_stream.put(None))
+            # متن جریان فقط وقتی نهایی می‌شود که get_gemini_analysis بدون خطا تمام شده باشد
+            broadcaster.stream_message(iter(ai_stream.get, None), step='ai',
+                                       finalize=lambda text: format_ai_message(text) if ai_future.result() else None,
+                                       failure_notice="⚠️ تحلیل هوش مصنوعی در دسترس نیست.")
+        else:
+            ai_parts = [(market, future.result()) for market, future in ai_futures.items()]
+            ai_parts = [f"🏛 <b>بازار {MARKETS[market][1]}</b>\n\n{analysis}" if combined else analysis for market, analysis in ai_parts if analysis]
+            if ai_parts: broadcaster.send_message(format_ai_message(("\n\n" + "-" * 35 + "\n\n").join(ai_parts)), step='ai')
+        broadcaster.print_report()
+
+# --- خروجی رویدادهای تاریخی برای بک‌تست ---
+def export_events(path):
+    from indicators import compute_events, compute_indicators, write_events
+
+    df = load_market_data()
+    if df is None: return
+    events = compute_events(compute_indicators(df))
+    write_events(events, path)
+    print(f"✅ {len(events)} رویداد از {len(df)} روز معاملاتی در فایل '{path}' ذخیره شد.")
+    for event, count in events['event'].value_counts().items(): print(f"  - {event}: {count}")
+
+# --- رسم دسته‌ای شاخص برای بازه‌ای از روزهای گذشته ---
+def backfill_gauges(args):
+    from backfill import assemble_animation, build_contact_sheet, render_backfill
+
+    df = load_market_data()
+    if df is None: return
+    paths = render_backfill(df, args.start, args.end, args.out_dir, workers=args.workers, overwrite=args.overwrite)
+    if not paths: print("❌ هیچ روز معاملاتی در بازه انتخاب‌شده وجود ندارد."); return
+    if args.animate: assemble_animation(paths, args.animate, fps=args.fps)
+    if args.contact_sheet: build_contact_sheet(paths, args.contact_sheet)
+
+# --- سرویس دائمی: پایش لحظه‌ای در ساعات بازار ---
+def run_daemon(args):
+    from daemon import MarketWatcher
+
+    if not all([TELEGRAM_BOT_TOKEN, parse_chat_ids(TELEGRAM_CHAT_ID)]):
+        print("❌ متغیرهای محیطی تلگرام (TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID) تنظیم نشده‌اند.")
+        return
+    MarketWatcher(TELEGRAM_BOT_TOKEN, parse_chat_ids(TELEGRAM_CHAT_ID), args.interval, args.market_hours).run()
+
+def parse_markets(value):
+    markets = [market for market in value.replace(',', ' ').split() if market] if isinstance(value, str) else list(value)
+    unknown = [market for market in markets if market not in MARKETS]
+    if unknown or not markets: raise argparse.ArgumentTypeError(f"بازار نامعتبر: {', '.join(unknown) or value!r}")
+    return list(dict.fromkeys(markets))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="گزارش روزانه بازار سهام و شاخص ترس و طمع")
+    parser.add_argument('--events', metavar='PATH', help="محاسبه همه رویدادهای تاریخی (تقاطع‌ها، رکوردها، هشدارها) و ذخیره در CSV/Parquet")
+    backfill = parser.add_argument_group("رسم دسته‌ای شاخص روزهای گذشته")
+    backfill.add_argument('--backfill', action='store_true', help="رسم شاخص ترس و طمع برای همه روزهای معاملاتی بازه")
+    backfill.add_argument('--from', dest='start', metavar='1403/01/01', help="تاریخ شروع بازه (شمسی)")
+    backfill.add_argument('--to', dest='end', metavar='1403/12/29', help="تاریخ پایان بازه (شمسی)")
+    backfill.add_argument('--out-dir', default='gauge_frames', help="پوشه خروجی فریم‌ها")
+    backfill.add_argument('--workers', type=int, help="تعداد پردازه‌ها (پیش‌فرض: تعداد هسته‌ها)")
+    backfill.add_argument('--overwrite', action='store_true', help="رسم مجدد فریم‌هایی که از قبل وجود دارند")
+    backfill.add_argument('--animate', metavar='PATH', help="ساخت انیمیشن GIF یا MP4 از فریم‌ها")
+    backfill.add_argument('--fps', type=float, default=4)
+    backfill.add_argument('--contact-sheet', metavar='PATH', help="ساخت تصویر شبکه‌ای از فریم‌ها")
+    parser.add_argument('--markets', type=parse_markets, default=os.getenv("MARKETS", DEFAULT_MARKET), metavar='bourse,farabourse',
+                        help=f"بازارهای گزارش (جدا با ویرگول): {', '.join(MARKETS)}")
+    parser.add_argument('--no-ai-cache', action='store_true', default=os.getenv("GEMINI_CACHE", "on").lower() in ("off", "0", "false"),
+                        help="دریافت تحلیل تازه از جمنای بدون استفاده از کش پاسخ‌ها")
+    parser.add_argument('--stream-ai', action='store_true', default=os.getenv("GEMINI_STREAM", "off").lower() in ("on", "1", "true"),
+                        help="نمایش تدریجی تحلیل جمنای در تلگرام همزمان با تولید آن")
+    diagnostics = parser.add_argument_group("اندازه‌گیری کارایی")
+    diagnostics.add_argument('--metrics-json', metavar='PATH', default=os.getenv("METRICS_JSON"), help="ذخیره زمان و حافظه هر مرحله (دریافت، پارس، شاخص‌ها، رسم، تلگرام، جمنای) در JSON")
+    diagnostics.add_argument('--profile', metavar='PATH', help="ذخیره خروجی cProfile اجرای اصلی (قابل خواندن با pstats/snakeviz)")
+    daemon = parser.add_argument_group("سرویس دائمی (هشدار لحظه‌ای)")
+    daemon.add_argument('--daemon', action='store_true', help="اجرای دائمی و ارسال هشدار فقط هنگام تغییرات مهم")
+    daemon.add_argument('--interval', type=float, default=float(os.getenv("POLL_INTERVAL_SECONDS", 60)), help="فاصله دریافت داده (ثانیه)")
+    daemon.add_argument('--market-hours', default=os.getenv("MARKET_HOURS", "09:00-13:00"), metavar='09:00-13:00', help="بازه پایش به وقت تهران")
+    return parser.parse_args(argv)
+
+def run(args):
+    if args.events: export_events(args.events)
+    elif args.backfill: backfill_gauges(args)
+    elif args.daemon: run_daemon(args)
+    else: main(use_ai_cache=not args.no_ai_cache, stream_ai=args.stream_ai, markets=args.markets)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.metrics_json:
+        from metrics import enable_metrics
+
+        recorder = enable_metrics()
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with span('run'): run(args)
+    finally:
+        # cProfile فقط رشته اصلی را می‌بیند؛ زمان رشته جمنای در span مربوط به آن ثبت می‌شود
+        if profiler: profiler.disable(); profiler.dump_stats(args.profile); print(f"📈 پروفایل اجرا در '{args.profile}' ذخیره شد.")
+        if args.metrics_json: recorder.export(args.metrics_json); print(f"📈 زمان‌بندی مراحل در '{args.metrics_json}' ذخیره شد.")
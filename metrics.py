@@ -0,0 +1,93 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# --- اندازه‌گیری مراحل اجرا (زمان و حافظه) ---
+# هر مرحله (دریافت، پارس، ساخت دیتافریم، شاخص‌ها، رسم شاخص، هر تماس تلگرام، جمنای) یک span است.
+# تا وقتی enable_metrics فراخوانی نشده، span هزینه‌ای جز یک nullcontext ندارد.
+
+_recorder = None
+
+
+def _rss_mb():
+    # حافظه مقیم فعلی پردازه (فقط لینوکس)؛ در سیستم‌های دیگر None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MetricsRecorder:
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self._origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        # attrs در طول مرحله قابل تکمیل است (مثلاً کد وضعیت یا تعداد ردیف‌ها)
+        stack = self._local.__dict__.setdefault('stack', [])
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None,
+                  'thread': threading.current_thread().name, 'attrs': attrs}
+        rss_before, cpu_start, start = _rss_mb(), time.thread_time(), time.perf_counter()
+        stack.append(record)
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs['error'] = e.__class__.__name__
+            raise
+        finally:
+            end, rss_after = time.perf_counter(), _rss_mb()
+            stack.pop()
+            record.update(start_ms=round((start - self._origin) * 1000, 3), duration_ms=round((end - start) * 1000, 3),
+                          cpu_ms=round((time.thread_time() - cpu_start) * 1000, 3), rss_mb=rss_after,
+                          rss_delta_mb=rss_after - rss_before if rss_before is not None and rss_after is not None else None)
+            with self._lock: self.spans.append(record)
+
+    def summary(self):
+        # جمع زمان هر مرحله: {name: {count, total_ms, max_ms}}
+        stages = {}
+        for record in sorted(self.spans, key=lambda record: record['start_ms']):
+            stage = stages.setdefault(record['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stage['count'] += 1
+            stage['total_ms'] = round(stage['total_ms'] + record['duration_ms'], 3)
+            stage['max_ms'] = max(stage['max_ms'], record['duration_ms'])
+        return stages
+
+    def to_dict(self):
+        with self._lock: spans = sorted(self.spans, key=lambda record: record['start_ms'])
+        return {'started': self.started.isoformat(), 'total_ms': round((time.perf_counter() - self._origin) * 1000, 3),
+                'peak_rss_mb': _peak_rss_mb(), 'stages': self.summary(), 'spans': spans}
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        return path
+
+
+def enable_metrics():
+    global _recorder
+    _recorder = MetricsRecorder()
+    return _recorder
+
+
+def get_recorder():
+    return _recorder
+
+
+def span(name, **attrs):
+    return _recorder.span(name, **attrs) if _recorder else contextlib.nullcontext(attrs)
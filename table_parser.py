@@ -0,0 +1,158 @@
+import pandas as pd
+
+from history_store import HISTORY_COLUMNS, date_key
+from metrics import span
+
+# --- پارسر سریع جدول تاریخچه بازار (table.sticky.market) ---
+# فقط ستون‌های مورد نیاز خوانده می‌شوند و تبدیل عددی به صورت برداری روی کل ستون انجام می‌شود.
+
+# شماره ستون (td) هر فیلد در جدول منبع
+COLUMN_INDEX = {
+    "تاریخ": 1, "ارزش معاملات": 2,
+    "قدرت خريد": 15, "قدرت 5 روزه": 16, "قدرت 20 روزه": 17,
+    "ورود پول": 18, "ورود پول 5 روزه": 19, "ورود پول 20 روزه": 20,
+    "شاخص کل": 21, "شاخص هم‌وزن": 22,
+}
+FINANCIAL_COLUMNS = ["ارزش معاملات", "قدرت خريد", "قدرت 5 روزه", "قدرت 20 روزه", "ورود پول", "ورود پول 5 روزه", "ورود پول 20 روزه"]
+INDEX_COLUMNS = ["شاخص کل", "شاخص هم‌وزن"]
+MIN_CELLS = max(COLUMN_INDEX.values()) + 1
+
+MARKET_TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' sticky ') and contains(concat(' ', normalize-space(@class), ' '), ' market ')]"
+
+
+def parse_financial_string(s):
+    if not isinstance(s, str): return 0.0
+    s = s.strip().replace(',', '')
+    try:
+        if 'B' in s.upper(): return float(s.upper().replace('B', '').strip())
+        if 'M' in s.upper(): return float(s.upper().replace('M', '').strip()) / 1000.0
+        return float(s)
+    except (ValueError, AttributeError): return 0.0
+
+def parse_index_string(s):
+    if not isinstance(s, str): return 0
+    try:
+        return int(s.strip().replace(',', ''))
+    except (ValueError, AttributeError): return 0
+
+
+def parse_financial_series(series):
+    # معادل برداری parse_financial_string؛ سلول‌هایی که to_numeric نمی‌شناسد (مثل ارقام فارسی)
+    # به همان تابع تکی سپرده می‌شوند تا رفتار دقیقاً یکسان بماند
+    text = series.astype(str).str.strip().str.replace(',', '', regex=False).str.upper()
+    has_b = text.str.contains('B', regex=False)
+    has_m = ~has_b & text.str.contains('M', regex=False)
+    numbers = text.where(~has_b, text.str.replace('B', '', regex=False).str.strip())
+    numbers = numbers.where(~has_m, numbers.str.replace('M', '', regex=False).str.strip())
+    values = pd.to_numeric(numbers, errors='coerce').astype('float64')
+    values = values.where(~has_m, values / 1000.0)
+    unresolved = values.isna() & series.map(lambda s: isinstance(s, str))
+    if unresolved.any():
+        values[unresolved] = series[unresolved].map(parse_financial_string)
+    return values.fillna(0.0)
+
+def parse_index_series(series):
+    text = series.astype(str).str.strip().str.replace(',', '', regex=False)
+    values = pd.to_numeric(text.where(text.str.fullmatch(r'[+-]?\d+')), errors='coerce')
+    unresolved = values.isna() & series.map(lambda s: isinstance(s, str))
+    if unresolved.any():
+        values[unresolved] = series[unresolved].map(parse_index_string)
+    return values.fillna(0).astype('int64')
+
+
+def convert_raw_rows(raw):
+    # raw: دیتافریم رشته‌ای با ستون‌های COLUMN_INDEX (به ترتیب منبع، جدید به قدیم)
+    df = pd.DataFrame({"تاریخ": raw["تاریخ"].astype(str)})
+    for column in FINANCIAL_COLUMNS: df[column] = parse_financial_series(raw[column])
+    for column in INDEX_COLUMNS: df[column] = parse_index_series(raw[column])
+    df = df[df['ارزش معاملات'] > 0].reset_index(drop=True)
+    return df[[column for column, _, _ in HISTORY_COLUMNS]]
+
+
+def extract_raw_rows_lxml(html_text):
+    from lxml import html as lxml_html
+
+    tree = lxml_html.fromstring(html_text)
+    tables = tree.xpath(MARKET_TABLE_XPATH)
+    if not tables: raise ValueError("جدول تاریخچه بازار (table.sticky.market) در صفحه یافت نشد.")
+    columns = {column: [] for column in COLUMN_INDEX}
+    for tr in list(tables[0].iter('tr'))[1:]:
+        tds = tr.findall('td')
+        if len(tds) < MIN_CELLS: continue
+        for column, index in COLUMN_INDEX.items():
+            columns[column].append(tds[index].text_content())
+    return pd.DataFrame(columns)
+
+def extract_raw_rows_bs4(html_text):
+    from bs4 import BeautifulSoup
+
+    columns = {column: [] for column in COLUMN_INDEX}
+    for tr in BeautifulSoup(html_text, 'html.parser').find('table', class_='sticky market').find_all('tr')[1:]:
+        tds = tr.find_all('td')
+        if len(tds) < MIN_CELLS: continue
+        for column, index in COLUMN_INDEX.items():
+            columns[column].append(tds[index].text)
+    return pd.DataFrame(columns)
+
+
+def parse_market_table(html_text):
+    # خروجی به ترتیب منبع (جدید به قدیم)؛ در نبود lxml از BeautifulSoup استفاده می‌شود
+    try:
+        raw = extract_raw_rows_lxml(html_text)
+    except ImportError:
+        raw = extract_raw_rows_bs4(html_text)
+    return convert_raw_rows(raw)
+
+
+# --- پارس جریانی: ردیف‌ها همزمان با دانلود و به محض بسته شدن هر <tr> استخراج می‌شوند ---
+def _is_market_table(elem):
+    classes = (elem.get('class') or '').split()
+    return 'sticky' in classes and 'market' in classes
+
+def _reached_known_date(row, stop_at_key):
+    try: return date_key(row["تاریخ"]) <= stop_at_key
+    except ValueError: return False
+
+def iter_raw_rows_stream(chunks, encoding='utf-8', stop_at_key=None):
+    # هر ردیف یک دیکشنری رشته‌ای است. با رسیدن به تاریخی که قبلاً ذخیره شده (کلید <= stop_at_key)
+    # همان ردیف برگردانده شده و خواندن ادامه پاسخ متوقف می‌شود.
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+    table, seen_header = None, False
+    for chunk in chunks:
+        if not chunk: continue
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if table is None and elem.tag == 'table' and _is_market_table(elem): table = elem
+                continue
+            if elem is table: return
+            if table is None or elem.tag != 'tr': continue
+            if seen_header:
+                tds = elem.findall('td')
+                if len(tds) >= MIN_CELLS:
+                    row = {column: "".join(tds[index].itertext()) for column, index in COLUMN_INDEX.items()}
+                    yield row
+                    if stop_at_key is not None and _reached_known_date(row, stop_at_key): return
+            seen_header = True
+            # آزاد کردن ردیف‌های پردازش‌شده تا مصرف حافظه به اندازه صفحه وابسته نباشد
+            elem.clear()
+            parent = elem.getparent()
+            while parent is not None and elem.getprevious() is not None:
+                del parent[0]
+
+def stream_market_table(chunks, encoding='utf-8', stop_at_key=None):
+    # خروجی: (دیتافریم به ترتیب منبع، آیا به تاریخ ذخیره‌شده رسیدیم)
+    try:
+        # زمان parse شامل انتظار برای دریافت تکه‌های پاسخ هم هست چون پارس همزمان با دانلود انجام می‌شود
+        with span('parse', streaming=True) as attrs:
+            rows = list(iter_raw_rows_stream(chunks, encoding, stop_at_key))
+            attrs['rows'] = len(rows)
+        with span('dataframe', rows=len(rows)):
+            df = convert_raw_rows(pd.DataFrame(rows, columns=list(COLUMN_INDEX)))
+    except ImportError:
+        df = parse_market_table(b"".join(chunks).decode(encoding, errors='replace'))
+        rows = df.to_dict('records')
+    reached = stop_at_key is not None and any(_reached_known_date(row, stop_at_key) for row in rows)
+    return df, reached
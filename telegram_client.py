@@ -0,0 +1,326 @@
+import io
+import mimetypes
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+
+# --- ارتباط با Bot API تلگرام ---
+# همه درخواست‌ها از یک Session مشترک (اتصال keep-alive) استفاده می‌کنند و خطاهای موقت
+# (قطعی شبکه، 5xx و 429) با تأخیر نمایی و با رعایت retry_after تلگرام دوباره تلاش می‌شوند.
+
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+# تلگرام محدودیت 4096 کاراکتر دارد. ما 4000 در نظر می‌گیریم تا ایمن باشد.
+MAX_MESSAGE_LENGTH = 4000
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# محدودیت‌های تلگرام: حدود ۳۰ پیام در ثانیه در کل و حدود ۱ پیام در ثانیه برای هر گفتگو/گروه
+GLOBAL_MESSAGES_PER_SECOND = 30
+PER_CHAT_INTERVAL_SECONDS = 1.0
+# تلگرام ارسال‌های کوتاه پشت‌سرهم را می‌پذیرد؛ تا این تعداد پیام بدون فاصله و بعد از آن با همان نرخ ۱ پیام در ثانیه
+PER_CHAT_BURST = 3
+MAX_PARALLEL_CHATS = 8
+# حداقل فاصله ویرایش پیام در حال تولید (پخش تدریجی تحلیل)
+EDIT_INTERVAL_SECONDS = 1.5
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        return _session
+
+
+def _backoff_delay(attempt):
+    return min(BACKOFF_BASE_SECONDS * 2 ** attempt, BACKOFF_MAX_SECONDS) + random.uniform(0, 0.5)
+
+
+def _rewind_files(files):
+    for value in (files or {}).values():
+        stream = value[1] if isinstance(value, tuple) else value
+        if hasattr(stream, 'seek'): stream.seek(0)
+
+
+def call_telegram(token, method, data=None, json=None, files=None, timeout=30):
+    # خروجی: بدنه JSON پاسخ؛ خطاهای دائمی (مثل 400) بلافاصله به صورت HTTPError برمی‌گردند
+    import requests
+
+    api_url = f"{TELEGRAM_API_BASE}/bot{token}/{method}"
+    with span(f'telegram.{method}', chat_id=(data or json or {}).get('chat_id')) as attrs:
+        for attempt in range(MAX_RETRIES + 1):
+            attrs['attempts'] = attempt + 1
+            _rewind_files(files)
+            try:
+                response = get_session().post(api_url, data=data, json=json, files=files, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == MAX_RETRIES: raise
+                delay, reason = _backoff_delay(attempt), f"خطای شبکه ({e.__class__.__name__})"
+            else:
+                attrs['status'] = response.status_code
+                if response.status_code == 429:
+                    try: retry_after = response.json().get('parameters', {}).get('retry_after')
+                    except ValueError: retry_after = None
+                    delay, reason = (retry_after + 0.1 if retry_after else _backoff_delay(attempt)), "محدودیت نرخ تلگرام (429)"
+                elif response.status_code >= 500:
+                    delay, reason = _backoff_delay(attempt), f"خطای سرور ({response.status_code})"
+                else:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == MAX_RETRIES: response.raise_for_status()
+            print(f"⏳ {method}: {reason}؛ تلاش مجدد پس از {delay:.1f} ثانیه...")
+            time.sleep(delay)
+
+
+def parse_chat_ids(value):
+    # TELEGRAM_CHAT_ID می‌تواند چند مقصد جدا شده با ویرگول یا فاصله باشد
+    return [chat_id for chat_id in (value or '').replace(',', ' ').split() if chat_id]
+
+
+class RateLimiter:
+    # زمان‌بندی ارسال: هر درخواست یک نوبت رزرو می‌کند که هم فاصله سراسری و هم سهمیه همان گفتگو را رعایت کند.
+    # سهمیه هر گفتگو یک سطل توکن (به شکل GCRA) است: تا burst پیام فوری و پس از آن یک پیام در هر per_chat_interval.
+    def __init__(self, global_per_second=GLOBAL_MESSAGES_PER_SECOND, per_chat_interval=PER_CHAT_INTERVAL_SECONDS, per_chat_burst=PER_CHAT_BURST):
+        self.global_interval = 1.0 / global_per_second
+        self.per_chat_interval = per_chat_interval
+        self.per_chat_tolerance = (max(per_chat_burst, 1) - 1) * per_chat_interval
+        self._next_global = 0.0
+        self._chat_tat = {}  # زمان نظری ورود بعدی هر گفتگو
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            tat = self._chat_tat.get(chat_id, now)
+            slot = max(now, self._next_global, tat - self.per_chat_tolerance)
+            self._next_global = slot + self.global_interval
+            self._chat_tat[chat_id] = max(tat, slot) + self.per_chat_interval
+        if slot > now:
+            with span('telegram.wait', chat_id=chat_id): time.sleep(slot - now)
+
+
+def split_message(text, max_length=MAX_MESSAGE_LENGTH):
+    messages_to_send = []
+
+    if len(text) <= max_length:
+        messages_to_send.append(text)
+    else:
+        while len(text) > max_length:
+            # پیدا کردن آخرین خط جدید (\n) قبل از رسیدن به محدودیت
+            # این کار باعث می‌شود جملات یا تگ‌های HTML وسط خط قطع نشوند
+            split_index = text[:max_length].rfind('\n')
+
+            # اگر خط جدید پیدا نشد، آخرین فاصله (Space) را پیدا کن
+            if split_index == -1:
+                split_index = text[:max_length].rfind(' ')
+
+            # اگر هیچ فاصله‌ای هم نبود، به ناچار در همان 4000 برش بزن
+            if split_index == -1:
+                split_index = max_length
+
+            messages_to_send.append(text[:split_index])
+            text = text[split_index:].lstrip() # حذف فاصله‌های اضافی ابتدای بخش بعدی
+
+        # اضافه کردن بخش باقیمانده
+        if text:
+            messages_to_send.append(text)
+    return messages_to_send
+
+
+def photo_file_id(result):
+    # بزرگ‌ترین نسخه عکس آپلودشده؛ برای ارسال مجدد به گفتگوهای دیگر بدون آپلود دوباره
+    photos = ((result or {}).get('result') or {}).get('photo') or []
+    return photos[-1].get('file_id') if photos else None
+
+def _photo_upload(photo):
+    # photo می‌تواند مسیر فایل، bytes/memoryview یا یک بافر باز (مثل BytesIO خروجی شاخص) باشد
+    if isinstance(photo, (bytes, bytearray, memoryview)): photo = io.BytesIO(photo)
+    if hasattr(photo, 'read'):
+        name = os.path.basename(getattr(photo, 'name', None) or 'photo.png')
+        return None, (name, photo, mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    stream = open(photo, 'rb')
+    return stream, (os.path.basename(photo), stream, mimetypes.guess_type(photo)[0] or 'application/octet-stream')
+
+def send_photo_to_telegram(token, chat_id, photo, caption="", file_id=None, limiter=None):
+    print("\nدر حال ارسال عکس به تلگرام...")
+    data = {'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'}
+    try:
+        if limiter: limiter.acquire(chat_id)
+        if file_id:
+            result = call_telegram(token, 'sendPhoto', data={**data, 'photo': file_id}, timeout=30)
+        else:
+            opened, upload = _photo_upload(photo)
+            try:
+                result = call_telegram(token, 'sendPhoto', data=data, files={'photo': upload}, timeout=30)
+            finally:
+                if opened: opened.close()
+        if result.get("ok"): print("✅ عکس با موفقیت به تلگرام ارسال شد.")
+        else: print(f"❌ خطا در ارسال عکس: {result}")
+        return result
+    except Exception as e: print(f"خطا در فرآیند ارسال عکس: {e}")
+
+# <<< تابع اصلاح شده برای مدیریت پیام‌های طولانی >>>
+def send_message_to_telegram(token, chat_id, text, limiter=None):
+    print("در حال ارسال پیام متنی به تلگرام...")
+    messages_to_send = split_message(text)
+    if len(messages_to_send) > 1: print(f"⚠️ پیام طولانی است ({len(text)} کاراکتر). در حال بخش‌بندی پیام...")
+    results = []
+
+    # ارسال تک تک بخش‌ها
+    for i, msg in enumerate(messages_to_send):
+        payload = {'chat_id': chat_id, 'text': msg, 'parse_mode': 'HTML'}
+        try:
+            if limiter: limiter.acquire(chat_id)
+            result = call_telegram(token, 'sendMessage', json=payload, timeout=20)
+            results.append(result)
+            if result.get("ok"):
+                print(f"✅ پیام متنی (بخش {i+1} از {len(messages_to_send)}) با موفقیت ارسال شد.")
+            else:
+                print(f"❌ خطا در ارسال پیام متنی بخش {i+1}: {result}")
+        except Exception as e:
+            print(f"خطا در فرآیند ارسال پیام متنی بخش {i+1}: {e}")
+    return results
+
+
+def edit_message_text(token, chat_id, message_id, text, parse_mode=None, limiter=None):
+    import requests
+
+    payload = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+    if parse_mode: payload['parse_mode'] = parse_mode
+    if limiter: limiter.acquire(chat_id)
+    try:
+        return call_telegram(token, 'editMessageText', json=payload, timeout=20)
+    except requests.HTTPError as e:
+        # ویرایش با متن تکراری خطا نیست
+        if e.response is not None and 'message is not modified' in e.response.text: return {'ok': True}
+        raise
+
+
+class ProgressiveMessage:
+    # نمایش متنی که هنوز در حال تولید است در یک گفتگو: بخش‌های جاری با editMessageText به‌روز می‌شوند و
+    # با عبور از مرز تقسیم split_message پیام جدیدی ارسال می‌شود. تا نسخه نهایی، متن بدون parse_mode
+    # ارسال می‌شود چون تگ‌های HTML نیمه‌کاره توسط تلگرام رد می‌شوند.
+    def __init__(self, token, chat_id, limiter=None):
+        self.token, self.chat_id, self.limiter = token, chat_id, limiter
+        self.message_ids, self.shown = [], []
+
+    def update(self, text, parse_mode=None):
+        # خروجی: آیا همه بخش‌ها با موفقیت نمایش داده شدند
+        ok = True
+        for i, part in enumerate(split_message(text)):
+            try:
+                if i < len(self.message_ids):
+                    if part == self.shown[i] and not parse_mode: continue
+                    result = edit_message_text(self.token, self.chat_id, self.message_ids[i], part, parse_mode, self.limiter)
+                else:
+                    payload = {'chat_id': self.chat_id, 'text': part, **({'parse_mode': parse_mode} if parse_mode else {})}
+                    if self.limiter: self.limiter.acquire(self.chat_id)
+                    result = call_telegram(self.token, 'sendMessage', json=payload, timeout=20)
+                    if result.get('ok'): self.message_ids.append(result['result']['message_id']); self.shown.append(None)
+                if not result.get('ok'): ok = False; print(f"❌ خطا در نمایش تدریجی بخش {i+1}: {result}"); break
+                self.shown[i] = part
+            except Exception as e:
+                print(f"خطا در فرآیند نمایش تدریجی بخش {i+1}: {e}")
+                return False
+        return ok
+
+    def retract(self, notice):
+        # متن نیمه‌کاره نباید باقی بماند: بخش اول با notice جایگزین و بقیه بخش‌ها حذف می‌شوند
+        for message_id in self.message_ids[1:]:
+            try:
+                if self.limiter: self.limiter.acquire(self.chat_id)
+                call_telegram(self.token, 'deleteMessage', json={'chat_id': self.chat_id, 'message_id': message_id}, timeout=20)
+            except Exception as e:
+                print(f"خطا در حذف بخش نیمه‌کاره: {e}")
+        del self.message_ids[1:], self.shown[1:]
+        if self.message_ids: self.update(notice)
+
+
+# --- ارسال یک گزارش به چند کانال/گروه ---
+class TelegramBroadcaster:
+    # هر مرحله (عکس، پیام داده، پیام تحلیل) برای همه مقصدها به صورت موازی ارسال و سپس منتظر می‌ماند،
+    # پس ترتیب پیام‌ها در هر گفتگو حفظ می‌شود. نتیجه هر مرحله برای هر مقصد در results ثبت می‌شود.
+    def __init__(self, token, chat_ids, limiter=None):
+        self.token = token
+        self.chat_ids = list(chat_ids)
+        self.limiter = limiter or RateLimiter()
+        self.results = {chat_id: [] for chat_id in self.chat_ids}
+
+    def _record(self, chat_id, step, ok, detail=None):
+        self.results[chat_id].append({'step': step, 'ok': ok, 'detail': detail})
+
+    def _fan_out(self, chat_ids, func):
+        if len(chat_ids) == 1: return [func(chat_ids[0])]
+        with ThreadPoolExecutor(max_workers=min(len(chat_ids), MAX_PARALLEL_CHATS)) as executor:
+            return list(executor.map(func, chat_ids))
+
+    def send_photo(self, photo, caption=""):
+        # عکس فقط یک‌بار آپلود می‌شود (در صورت خطا، مقصد بعدی امتحان می‌شود) و بقیه با file_id دریافت می‌کنند
+        file_id, remaining = None, list(self.chat_ids)
+        while remaining and not file_id:
+            chat_id = remaining.pop(0)
+            result = send_photo_to_telegram(self.token, chat_id, photo, caption, limiter=self.limiter)
+            file_id = photo_file_id(result)
+            self._record(chat_id, 'photo', bool(result and result.get('ok')), result if not file_id else None)
+
+        def resend(chat_id):
+            result = send_photo_to_telegram(self.token, chat_id, photo, caption, file_id=file_id, limiter=self.limiter)
+            self._record(chat_id, 'photo', bool(result and result.get('ok')), None if result and result.get('ok') else result)
+        if remaining: self._fan_out(remaining, resend)
+        return file_id
+
+    def send_message(self, text, step='message'):
+        def send(chat_id):
+            results = send_message_to_telegram(self.token, chat_id, text, limiter=self.limiter)
+            expected = len(split_message(text)) if text else 0
+            ok = len(results) == expected and all(result.get('ok') for result in results)
+            self._record(chat_id, step, ok, None if ok else f"{sum(1 for r in results if r.get('ok'))}/{expected}")
+        self._fan_out(self.chat_ids, send)
+
+    def stream_message(self, pieces, step='message', finalize=None, failure_notice="⚠️ متن در دسترس نیست."):
+        # pieces: تکه‌های متن به ترتیب تولید؛ اولین پیام با کامل شدن خط اول (تیتر) ارسال و سپس حداکثر هر
+        # EDIT_INTERVAL_SECONDS ثانیه ویرایش می‌شود. در پایان finalize(text) با parse_mode=HTML جایگزین می‌شود؛
+        # اگر finalize مقدار None برگرداند (تولید متن ناقص ماند) یا تلگرام نسخه نهایی را رد کند (مثلاً HTML نامعتبر)،
+        # پیام‌های ارسال‌شده با failure_notice جایگزین می‌شوند تا متن خام و بدون هشدار منتشرشده باقی نماند.
+        messages = {chat_id: ProgressiveMessage(self.token, chat_id, self.limiter) for chat_id in self.chat_ids}
+        text, last_update = "", 0.0
+        for piece in pieces:
+            text += piece
+            if '\n' not in text.lstrip() or time.monotonic() - last_update < EDIT_INTERVAL_SECONDS: continue
+            snapshot = text
+            self._fan_out(self.chat_ids, lambda chat_id: messages[chat_id].update(snapshot))
+            last_update = time.monotonic()
+        final_text = finalize(text) if finalize else text
+        if final_text is None:
+            def fail(chat_id):
+                messages[chat_id].retract(failure_notice)
+                self._record(chat_id, step, False, 'stream failed')
+            self._fan_out(self.chat_ids, fail)
+            return None
+        if not text.strip(): return text
+
+        def finish(chat_id):
+            ok = messages[chat_id].update(final_text, parse_mode='HTML')
+            self._record(chat_id, step, ok, None if ok else f"{len(messages[chat_id].message_ids)}/{len(split_message(final_text))}")
+            if not ok: messages[chat_id].retract(failure_notice)
+        self._fan_out(self.chat_ids, finish)
+        return text
+
+    def print_report(self):
+        print("\n📬 نتیجه ارسال به مقصدها:")
+        for chat_id, steps in self.results.items():
+            summary = "، ".join(f"{step['step']} {'✅' if step['ok'] else '❌'}" for step in steps)
+            print(f"  - {chat_id}: {summary}")
+        return self.results